@@ -1,14 +1,17 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, url_for
 import qrcode
 from PIL import Image
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
-import os
 import random
 import string
 import io
+import os
 import base64
 from datetime import datetime
+import render_pool
+import label_assets
+from jobs import job_queue
 
 app = Flask(__name__)
 
@@ -16,7 +19,6 @@ app = Flask(__name__)
 LOGO_SIZE = (80, 80)
 QR_SIZE = (200, 200)
 QR_VERSION = 1
-LOGO_FILE_NAME = '02.jpg'
 
 def generate_item_code():
     """Generate a random 6-character alphanumeric code for items."""
@@ -40,25 +42,26 @@ def generate_qr_code_image(item_id, item_code):
     # Make a QR code image
     qr_image = qr.make_image(fill_color="black", back_color="white").convert('RGB')
     
-    try:
-        # Open and resize the logo image
-        logo_path = os.path.join(os.getcwd(), LOGO_FILE_NAME)
-        if os.path.exists(logo_path):
-            logo = Image.open(logo_path)
-            logo_resized = logo.resize(LOGO_SIZE)
-            
-            # Calculate the logo position
-            logo_x = (qr_image.size[0] - logo_resized.size[0]) // 2
-            logo_y = (qr_image.size[1] - logo_resized.size[1]) // 2
-            logo_position = (logo_x, logo_y)
-            
-            # Paste the logo on the QR code image
-            qr_image.paste(logo_resized, logo_position)
-    except Exception as e:
-        print(f'Logo error: {e}')
+    # Logo is decoded and resized once per process
+    logo_resized = label_assets.get_logo(LOGO_SIZE)
+    if logo_resized is not None:
+        # Calculate the logo position
+        logo_x = (qr_image.size[0] - logo_resized.size[0]) // 2
+        logo_y = (qr_image.size[1] - logo_resized.size[1]) // 2
+        logo_position = (logo_x, logo_y)
+        
+        # Paste the logo on the QR code image
+        qr_image.paste(logo_resized, logo_position)
     
     return qr_image
 
+def render_qr_png(args):
+    """Render one (item_id, item_code) QR as PNG bytes, runs on the render pool."""
+    item_id, item_code = args
+    buffered = io.BytesIO()
+    generate_qr_code_image(item_id, item_code).save(buffered, format="PNG")
+    return buffered.getvalue()
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -95,15 +98,12 @@ def generate_batch():
     data = request.json
     num_items = data.get('num_items', 32)
     
+    tasks = [(i, generate_item_code()) for i in range(1, num_items + 1)]
+    
     qr_codes = []
-    for i in range(1, num_items + 1):
-        item_code = generate_item_code()
-        qr_image = generate_qr_code_image(i, item_code)
-        
+    for (i, item_code), png in zip(tasks, render_pool.imap_ordered(render_qr_png, tasks)):
         # Convert to base64
-        buffered = io.BytesIO()
-        qr_image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+        img_str = base64.b64encode(png).decode()
         
         qr_codes.append({
             'item_id': i,
@@ -116,15 +116,12 @@ def generate_batch():
         'qr_codes': qr_codes
     })
 
-@app.route('/generate_pdf', methods=['POST'])
-def generate_pdf():
-    data = request.json
-    num_items = data.get('num_items', 32)
-    num_columns = data.get('num_columns', 8)
-    
-    # Create PDF in memory
-    pdf_buffer = io.BytesIO()
-    c = canvas.Canvas(pdf_buffer, pagesize=A4)
+def write_qr_pdf(fileobj, num_items, num_columns, progress=None):
+    """Draw num_items random-code QR codes into a PDF, num_columns per column.
+
+    progress, if given, is called with the number of codes drawn so far.
+    """
+    c = canvas.Canvas(fileobj, pagesize=A4)
     
     # PDF generation logic (similar to original main.py)
     QR_PDF_SIZE = (80, 80)
@@ -133,69 +130,102 @@ def generate_pdf():
     num_full_columns = num_items // num_columns
     remaining_items = num_items % num_columns
     
-    # Generate QR codes for full columns
+    # Layout positions for full columns, then the last column
+    positions = []
     for column in range(num_full_columns):
         for row in range(num_columns):
-            item_id = column * num_columns + row + 1
-            item_code = generate_item_code()
-            
-            x_position = 20 + column * (QR_PDF_SIZE[0] + 20)
-            y_position = A4[1] - 40 - row * (QR_PDF_SIZE[1] + 20) - QR_PDF_SIZE[1]
-            
-            # Generate QR code
-            qr_image = generate_qr_code_image(item_id, item_code)
-            
-            # Draw QR code on PDF
-            img_buffer = io.BytesIO()
-            qr_image.save(img_buffer, format='PNG')
-            img_buffer.seek(0)
-            
-            c.drawInlineImage(qr_image, x_position, y_position, 
-                            width=QR_PDF_SIZE[0], height=QR_PDF_SIZE[1])
-            
-            # Draw item code text
-            c.setFont("Helvetica", 10)
-            text_width = c.stringWidth(item_code, "Helvetica", 10)
-            x_text = x_position + (QR_PDF_SIZE[0] - text_width) / 2
-            y_text = y_position - 10
-            c.drawString(x_text, y_text, item_code)
-    
-    # Generate QR codes for the last column
+            positions.append((column, row, column * num_columns + row + 1))
     for row in range(remaining_items):
-        item_id = num_full_columns * num_columns + row + 1
-        item_code = generate_item_code()
-        
-        x_position = 20 + num_full_columns * (QR_PDF_SIZE[0] + 20)
+        positions.append((num_full_columns, row, num_full_columns * num_columns + row + 1))
+    
+    tasks = [(item_id, generate_item_code()) for _, _, item_id in positions]
+    
+    # QR codes render on the pool, drawn in order as they come back
+    c.setFont("Helvetica", 10)
+    for drawn, ((column, row, _), (item_id, item_code), png) in enumerate(
+            zip(positions, tasks, render_pool.imap_ordered(render_qr_png, tasks)), 1):
+        x_position = 20 + column * (QR_PDF_SIZE[0] + 20)
         y_position = A4[1] - 40 - row * (QR_PDF_SIZE[1] + 20) - QR_PDF_SIZE[1]
         
-        # Generate QR code
-        qr_image = generate_qr_code_image(item_id, item_code)
-        
         # Draw QR code on PDF
+        qr_image = Image.open(io.BytesIO(png))
         c.drawInlineImage(qr_image, x_position, y_position, 
                         width=QR_PDF_SIZE[0], height=QR_PDF_SIZE[1])
         
         # Draw item code text
-        c.setFont("Helvetica", 10)
         text_width = c.stringWidth(item_code, "Helvetica", 10)
         x_text = x_position + (QR_PDF_SIZE[0] - text_width) / 2
         y_text = y_position - 10
         c.drawString(x_text, y_text, item_code)
+        
+        if progress:
+            progress(drawn)
     
     # Save PDF
     c.save()
-    pdf_buffer.seek(0)
-    
-    # Generate filename with timestamp
+
+def pdf_filename():
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f'QR_Codes_{timestamp}.pdf'
+    return f'QR_Codes_{timestamp}.pdf'
+
+@app.route('/generate_pdf', methods=['POST'])
+def generate_pdf():
+    data = request.json
+    num_items = data.get('num_items', 32)
+    num_columns = data.get('num_columns', 8)
+    
+    # Create PDF in memory
+    pdf_buffer = io.BytesIO()
+    write_qr_pdf(pdf_buffer, num_items, num_columns)
+    pdf_buffer.seek(0)
     
     return send_file(
         pdf_buffer,
         mimetype='application/pdf',
         as_attachment=True,
-        download_name=filename
+        download_name=pdf_filename()
     )
 
+def run_pdf_job(job, num_items, num_columns):
+    """Background generate_pdf writing to the job's file"""
+    job.progress(force=True, items_total=num_items, items_rendered=0)
+    with open(job.path, 'wb') as f:
+        write_qr_pdf(f, num_items, num_columns, progress=lambda drawn: job.progress(items_rendered=drawn))
+    job.set_file(pdf_filename(), 'application/pdf')
+
+def job_json(state):
+    data = {key: state[key] for key in ('id', 'kind', 'status', 'progress', 'error')}
+    data['status_url'] = url_for('job_status', job_id=state['id'])
+    if state['status'] == 'finished':
+        data['download_url'] = url_for('job_download', job_id=state['id'])
+    return data
+
+@app.route('/jobs/generate_pdf', methods=['POST'])
+def start_pdf_job():
+    """Same request as /generate_pdf, answered with a job to poll instead of the PDF"""
+    data = request.json
+    job_id = job_queue.submit('generate-pdf', run_pdf_job,
+                              data.get('num_items', 32), data.get('num_columns', 8))
+    return jsonify(job_json(job_queue.get(job_id))), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    state = job_queue.get(job_id)
+    if not state:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_json(state))
+
+@app.route('/jobs/<job_id>/download')
+def job_download(job_id):
+    state = job_queue.get(job_id)
+    if not state:
+        return jsonify({'error': 'Job not found'}), 404
+    if state['status'] != 'finished':
+        return jsonify(job_json(state)), 409
+    path = job_queue.artifact_path(job_id)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Job not found'}), 404
+    return send_file(path, mimetype=state['mimetype'], as_attachment=True, download_name=state['filename'])
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=8080)
\ No newline at end of file
@@ -0,0 +1,101 @@
+"""Time the SQL behind the index page on a large synthetic inventory.
+
+Usage: python benchmarks/bench_index_queries.py [--items 100000] [--budget-ms 50]
+
+Runs each query with and without the Item indexes and prints the SQLite
+query plan. Search is timed through the full-text index and, for
+comparison, through the old LIKE scan. Exits non-zero if any indexed query misses the budget.
+"""
+import argparse
+import statistics
+import time
+
+import synthetic
+
+import inventory_auth_app as inventory
+from inventory_auth_app import app, db, Item
+
+PAGE_SIZE = 48
+# Selective like a real lookup: prefix of 100 of the oldest item codes
+SEARCH_TERM = 'S00001'
+
+
+def index_queries():
+    """The queries one index page view runs, keyed by a short label"""
+    category, status, location = synthetic.CATEGORIES[2], synthetic.STATUSES[1], synthetic.LOCATIONS[7]
+    newest = Item.query.order_by(Item.created_at.desc())
+    return {
+        'page, no filter': newest.limit(PAGE_SIZE),
+        'page, category': newest.filter(Item.category == category).limit(PAGE_SIZE),
+        'page, status': newest.filter(Item.status == status).limit(PAGE_SIZE),
+        'page, location': newest.filter(Item.location == location).limit(PAGE_SIZE),
+        'page, search': inventory.apply_item_filters(Item.query, {'search': SEARCH_TERM}, ranked=True)
+                        .order_by(Item.created_at.desc()).limit(PAGE_SIZE),
+        'page, search (LIKE)': inventory.item_search._apply_like(Item.query, SEARCH_TERM)
+                               .order_by(Item.created_at.desc()).limit(PAGE_SIZE),
+        'facet counts category': inventory.facet_counts._count_query(Item.category),
+        'facet counts status': inventory.facet_counts._count_query(Item.status),
+        'facet counts location': inventory.facet_counts._count_query(Item.location),
+        'api page (updated_at, id)': Item.query.order_by(Item.updated_at, Item.id).limit(100),
+    }
+
+
+def time_query(query, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        query.all()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def query_plan(query):
+    statement = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {statement}')).fetchall()
+    return '; '.join(row[-1] for row in rows)
+
+
+def drop_indexes():
+    for index in Item.__table__.indexes:
+        index.drop(db.engine, checkfirst=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--budget-ms', type=float, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    synthetic.seed_items(inventory, args.items)
+
+    with app.app_context():
+        sqlite = db.engine.dialect.name == 'sqlite'
+
+        drop_indexes()
+        without = {label: time_query(q, args.repeat) for label, q in index_queries().items()}
+
+        inventory.upgrade_database()
+        db.session.execute(db.text('ANALYZE'))
+        with_indexes = {label: time_query(q, args.repeat) for label, q in index_queries().items()}
+
+        print(f'{args.items} items, median of {args.repeat} runs (budget {args.budget_ms:.0f} ms)')
+        print(f'{"query":<28} {"no index":>10} {"indexed":>10}')
+        over_budget = []
+        for label, query in index_queries().items():
+            print(f'{label:<28} {without[label]:>8.2f}ms {with_indexes[label]:>8.2f}ms')
+            if sqlite:
+                print(f'    plan: {query_plan(query)}')
+            if with_indexes[label] > args.budget_ms and 'LIKE' not in label:
+                over_budget.append(label)
+
+        total = sum(with_indexes[label] for label in with_indexes if not label.startswith('api') and 'LIKE' not in label)
+        print(f'index page total: {total:.2f} ms')
+
+    if over_budget:
+        print(f'Over budget: {", ".join(over_budget)}')
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
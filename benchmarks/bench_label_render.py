@@ -0,0 +1,76 @@
+"""Compare the per-item cost of the bulk export before and after sharing the QR matrix.
+
+Usage: python benchmarks/bench_label_render.py [num_items]
+"""
+import os
+import sys
+import time
+
+import qrcode
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import label_render
+
+BASE_URL = 'http://localhost:8080'
+
+
+def legacy_qr(url, box_size, border):
+    """QR rendering as the export did it before: full-size image, then downscaled"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+    return qr.make_image(fill_color="black", back_color="white").convert('RGB')
+
+
+def legacy_item(url, code, name):
+    """Two encodes and two LANCZOS resizes per item"""
+    label_qr = legacy_qr(url, 10, 4)
+    label_render.paste_logo(label_qr, 60)
+    label_qr.resize((label_render.LABEL_QR_SIZE, label_render.LABEL_QR_SIZE), Image.Resampling.LANCZOS)
+
+    cell_qr = legacy_qr(url, 6, 2)
+    cell_qr.resize((label_render.CELL_QR_SIZE, label_render.CELL_QR_SIZE), Image.Resampling.LANCZOS)
+
+
+def shared_item(url, code, name):
+    """One encode, each size rasterized directly"""
+    matrix = label_render.build_qr_matrix(url)
+    modules = len(matrix) + 2 * label_render.LABEL_QR_BORDER
+    qr_image = label_render.rasterize_qr(matrix, label_render.LABEL_QR_BORDER, label_render.LABEL_QR_SIZE)
+    label_render.paste_logo(qr_image, round(60 * label_render.LABEL_QR_SIZE / (modules * 10)))
+    label_render.rasterize_qr(matrix, label_render.CELL_QR_BORDER, label_render.CELL_QR_SIZE)
+
+
+def full_item(url, code, name):
+    """Complete shared pipeline including text and PNG encoding"""
+    label, cell = label_render.render_item_labels(url, code, name)
+    label_render.encode_png(label)
+
+
+def run(name, func, num_items):
+    start = time.perf_counter()
+    for i in range(num_items):
+        code = f'B{i:05d}'
+        func(label_render.item_url(BASE_URL, code), code, f'Benchmark item {i}')
+    elapsed = time.perf_counter() - start
+    print(f'{name:<28} {elapsed:8.3f}s total  {elapsed / num_items * 1000:8.2f} ms/item')
+    return elapsed
+
+
+if __name__ == '__main__':
+    num_items = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    print(f'QR encode + rasterize for {num_items} items')
+    legacy = run('legacy (encode twice)', legacy_item, num_items)
+    shared = run('shared matrix', shared_item, num_items)
+    print(f'speedup: {legacy / shared:.2f}x')
+    print()
+    run('shared pipeline end to end', full_item, num_items)
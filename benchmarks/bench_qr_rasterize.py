@@ -0,0 +1,118 @@
+"""Per-label cost of turning a QR module matrix into pixels.
+
+Compares qrcode's own PIL backend (one rectangle per module, RGB, LANCZOS
+down to label size), the per-module loop label_render used before,
+NumPy row/column repetition when NumPy is installed, and
+label_render.rasterize_qr.
+
+Usage: python benchmarks/bench_qr_rasterize.py [num_labels]
+"""
+import os
+import sys
+import time
+
+import qrcode
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import label_render
+
+BASE_URL = 'http://localhost:8080'
+
+
+def make_image_qr(url, border, size):
+    """Labels before the shared matrix: every module drawn by qrcode, RGB, LANCZOS down"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        box_size=10,
+        border=border,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+    image = qr.make_image(fill_color="black", back_color="white").convert('RGB')
+    return image.resize((size, size), Image.Resampling.LANCZOS)
+
+
+def module_loop_qr(matrix, border, size):
+    """Previous rasterize_qr: one bytearray store per dark module, NEAREST up"""
+    modules = len(matrix) + 2 * border
+    pixels = bytearray(b'\xff' * (modules * modules))
+    for y, row in enumerate(matrix):
+        offset = (y + border) * modules + border
+        for x, dark in enumerate(row):
+            if dark:
+                pixels[offset + x] = 0
+
+    image = Image.frombytes('L', (modules, modules), bytes(pixels))
+    return image.resize((size, size), Image.Resampling.NEAREST)
+
+
+def nearest_counts(modules, size):
+    # Pixels per module under Pillow's NEAREST mapping floor((i + 0.5) * modules / size)
+    counts = [0] * modules
+    for i in range(size):
+        counts[(2 * i + 1) * modules // (2 * size)] += 1
+    return counts
+
+
+_counts = {}
+
+
+def numpy_qr(matrix, border, size):
+    """Every pixel produced by NumPy: pad, then repeat rows and columns"""
+    modules = len(matrix) + 2 * border
+    counts = _counts.get((modules, size))
+    if counts is None:
+        counts = _counts[(modules, size)] = nearest_counts(modules, size)
+    pixels = np.full((modules, modules), 255, np.uint8)
+    pixels[border:modules - border, border:modules - border][np.array(matrix, dtype=bool)] = 0
+    pixels = np.repeat(np.repeat(pixels, counts, axis=0), counts, axis=1)
+    return Image.frombytes('L', (size, size), pixels.tobytes())
+
+
+def run(name, func, items, repeat=3):
+    # Best of a few runs, the single-label times are small enough to be noisy
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            func(*item)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{name:<34} {best / len(items) * 1000:8.3f} ms/label')
+    return best
+
+
+if __name__ == '__main__':
+    num_labels = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    urls = [label_render.item_url(BASE_URL, f'B{i:05d}') for i in range(num_labels)]
+    matrices = [label_render.build_qr_matrix(url) for url in urls]
+
+    for border, size in [(label_render.LABEL_QR_BORDER, label_render.LABEL_QR_SIZE),
+                         (label_render.CELL_QR_BORDER, label_render.CELL_QR_SIZE)]:
+        items = [(matrix, border, size) for matrix in matrices]
+        current = label_render.rasterize_qr
+        assert all(module_loop_qr(*item).tobytes() == current(*item).tobytes() for item in items[:20])
+
+        print(f'{size}px QR, {num_labels} labels')
+        legacy = run('qrcode make_image + LANCZOS', make_image_qr, [(url, border, size) for url in urls], repeat=1)
+        run('per-module loop', module_loop_qr, items)
+        if np is not None:
+            assert all(numpy_qr(*item).tobytes() == current(*item).tobytes() for item in items[:20])
+            run('NumPy repeat', numpy_qr, items)
+        fast = run('label_render.rasterize_qr', current, items)
+        print(f'rasterize_qr vs make_image: {legacy / fast:.0f}x')
+        print()
+
+    print('Whole render with the matrix given, no PNG encoding')
+    names = [(matrix, f'B{i:05d}', f'Benchmark item {i}') for i, matrix in enumerate(matrices)]
+    run('render_label', label_render.render_label, names)
+    run('render_sheet_cell', label_render.render_sheet_cell, names)
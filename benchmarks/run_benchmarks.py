@@ -0,0 +1,384 @@
+"""Benchmark the label rendering and export hot paths on synthetic inventories.
+
+Usage: python benchmarks/run_benchmarks.py [--items 1000,10000,100000] [--cases label,zip_export]
+                                           [--export-limit 2000] [--output results.json]
+                                           [--compare previous.json] [--max-slowdown 20]
+                                           [--max-rss-growth 10]
+
+Each inventory size gets its own SQLite file. Every case runs in a fresh
+process so its peak RSS is its own; render pool workers are reported
+separately as children_peak_rss_mb. Results are written as JSON (by
+default to benchmarks/results/) together with the git commit, so runs
+from different commits can be compared with --compare, which exits with
+an error when a timing or a peak RSS grew past its threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+BASE_URL = 'http://localhost:8080'
+# Items rendered one by one for the per-label cases
+SAMPLE_ITEMS = 200
+# Memory fields of every result, compared with --max-rss-growth
+RSS_KEYS = ('peak_rss_mb', 'children_peak_rss_mb')
+
+CASES = ['label', 'small_qr', 'sheet', 'zip_export', 'zip_reexport', 'pdf_export', 'app_generate_pdf', 'main_pdf',
+         'index_page', 'api_items']
+
+
+def peak_rss_mb(who):
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(who).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def per_item_ms(func, items):
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    return (time.perf_counter() - start) * 1000 / len(items)
+
+
+def median_ms(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+# Cases, run in the child process with DATABASE_URL pointing at the seeded inventory
+
+def case_label(inventory, args):
+    """/qr/<code>: one 3x5 cm label, rendered then PNG encoded"""
+    rows = sample_rows(inventory)
+    with inventory.app.test_request_context(base_url=BASE_URL):
+        labels = [inventory.generate_qr_code_image(row.code, row.name, with_label=True) for row in rows[:5]]
+        render = per_item_ms(lambda row: inventory.generate_qr_code_image(row.code, row.name, with_label=True), rows)
+    encode = per_item_ms(inventory.encode_png, labels * (len(rows) // len(labels)))
+    return {'labels': len(rows), 'render_ms_per_label': render, 'png_ms_per_label': encode}
+
+
+def case_small_qr(inventory, args):
+    """generate_small_qr_with_border: one A4 sheet cell"""
+    rows = sample_rows(inventory)
+    with inventory.app.test_request_context(base_url=BASE_URL):
+        render = per_item_ms(lambda row: inventory.generate_small_qr_with_border(row.code, row.name), rows)
+    return {'cells': len(rows), 'render_ms_per_cell': render}
+
+
+def case_sheet(inventory, args):
+    """generate_a4_qr_sheet: 80 cells on the render pool, then PNG encoded"""
+    rows = sample_rows(inventory)[:inventory.ITEMS_PER_SHEET]
+    with inventory.app.test_request_context(base_url=BASE_URL):
+        sheet = inventory.generate_a4_qr_sheet(rows)
+        render = median_ms(lambda: inventory.generate_a4_qr_sheet(rows), args.repeat)
+    encode = median_ms(lambda: inventory.encode_png(sheet), args.repeat)
+    return {'cells': len(rows), 'render_ms_per_sheet': render, 'png_ms_per_sheet': encode}
+
+
+def case_zip_export(inventory, args):
+    """/qr/download/all: labels and A4 sheets streamed into a ZIP"""
+    import label_cache
+
+    label_cache.label_cache.clear()
+    label_cache.sheet_cache.clear()
+    with inventory.app.app_context():
+        seconds, size = timed_zip_export(inventory, args)
+        items = export_count(inventory, args)
+    return {'items': items, 'seconds': seconds, 'ms_per_item': seconds * 1000 / items,
+            'zip_mb': size / (1024 * 1024)}
+
+
+def case_zip_reexport(inventory, args):
+    """/qr/download/all again after renaming one item: only its label and sheet are rendered"""
+    import label_cache
+
+    label_cache.label_cache.clear()
+    label_cache.sheet_cache.clear()
+    with inventory.app.app_context():
+        cold_seconds, _ = timed_zip_export(inventory, args)
+        warm_seconds, _ = timed_zip_export(inventory, args)
+
+        item = inventory.Item.query.order_by(inventory.Item.id).first()
+        item.name = f'{item.name} (renamed)'
+        inventory.db.session.commit()
+        label_cache.invalidate_item(item.code)
+        edited_seconds, _ = timed_zip_export(inventory, args)
+        items = export_count(inventory, args)
+    return {'items': items, 'cold_seconds': cold_seconds, 'unchanged_seconds': warm_seconds,
+            'one_edit_seconds': edited_seconds, 'one_edit_ms_per_item': edited_seconds * 1000 / items}
+
+
+def timed_zip_export(inventory, args):
+    from zip_stream import stream_zip
+
+    rows = export_rows(inventory, args)
+    start = time.perf_counter()
+    size = 0
+    for chunk in stream_zip(inventory.iter_qr_export_entries(rows, BASE_URL)):
+        size += len(chunk)
+    return time.perf_counter() - start, size
+
+
+def case_pdf_export(inventory, args):
+    """/qr/download/pdf: vector A4 label sheets"""
+    with inventory.app.app_context():
+        rows = export_rows(inventory, args)
+        with tempfile.TemporaryFile() as pdf_file:
+            start = time.perf_counter()
+            items = inventory.write_label_sheets(pdf_file, rows, BASE_URL)
+            seconds = time.perf_counter() - start
+            size = pdf_file.tell()
+    return {'items': items, 'seconds': seconds, 'ms_per_item': seconds * 1000 / items,
+            'pdf_mb': size / (1024 * 1024)}
+
+
+def case_app_generate_pdf(inventory, args):
+    """app.py /generate_pdf with as many codes as the export"""
+    import app as qr_app
+
+    items = export_count(inventory, args)
+    client = qr_app.app.test_client()
+    start = time.perf_counter()
+    response = client.post('/generate_pdf', json={'num_items': items, 'num_columns': 8})
+    seconds = time.perf_counter() - start
+    assert response.status_code == 200, response.status_code
+    return {'items': items, 'seconds': seconds, 'ms_per_item': seconds * 1000 / items}
+
+
+def case_main_pdf(inventory, args):
+    """main.py as a script: its fixed 32 codes written to QR_Codes.pdf"""
+    import runpy
+    import label_assets
+    import main
+
+    # The logo is looked up in the working directory, load it before leaving the repo
+    label_assets.get_logo(main.LOGO_SIZE)
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            seconds = median_ms(lambda: runpy.run_path(os.path.join(ROOT, 'main.py'), run_name='__main__'),
+                                args.repeat) / 1000
+        finally:
+            os.chdir(ROOT)
+    return {'items': 32, 'seconds': seconds, 'ms_per_item': seconds * 1000 / 32}
+
+
+def case_index_page(inventory, args):
+    """GET / rendered through the test client: first page, filtered, searched, deep page"""
+    client = inventory.app.test_client()
+    urls = {
+        'first_page_ms': '/',
+        'category_ms': '/?category=Tools',
+        'search_ms': '/?search=drill',
+        'page_20_ms': '/?page=20',
+        'fragment_ms': '/items/fragment?page=2',
+    }
+    for url in urls.values():
+        assert client.get(url).status_code == 200, url
+    return {label: median_ms(lambda: client.get(url), args.repeat) for label, url in urls.items()}
+
+
+def case_api_items(inventory, args):
+    """GET /api/items: first page, a page from the middle of the cursor, a narrow projection"""
+    import item_api
+
+    with inventory.app.app_context():
+        Item = inventory.Item
+        middle = (Item.query.order_by(Item.updated_at, Item.id)
+                  .offset(args.items // 2).with_entities(Item.updated_at, Item.id).first())
+        cursor = item_api.encode_cursor(middle.updated_at, middle.id)
+
+    client = inventory.app.test_client()
+    urls = {
+        'first_page_ms': '/api/items?limit=100',
+        'middle_page_ms': f'/api/items?limit=100&cursor={cursor}',
+        'max_page_ms': '/api/items?limit=1000',
+        'codes_only_ms': '/api/items?limit=1000&fields=code,quantity',
+    }
+    for url in urls.values():
+        assert client.get(url).status_code == 200, url
+    return {label: median_ms(lambda: client.get(url), args.repeat) for label, url in urls.items()}
+
+
+def sample_rows(inventory):
+    with inventory.app.app_context():
+        return inventory.db.session.query(inventory.Item.code, inventory.Item.name) \
+            .order_by(inventory.Item.id).limit(SAMPLE_ITEMS).all()
+
+
+def export_rows(inventory, args):
+    query = inventory.db.session.query(inventory.Item.code, inventory.Item.name).order_by(inventory.Item.id)
+    if args.export_limit:
+        query = query.limit(args.export_limit)
+    return query.yield_per(inventory.QR_EXPORT_CHUNK_SIZE)
+
+
+def export_count(inventory, args):
+    return min(args.items, args.export_limit) if args.export_limit else args.items
+
+
+def run_case(args):
+    """Child process: run one case and print its metrics as the last line"""
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    import inventory_auth_app as inventory
+
+    start = time.perf_counter()
+    metrics = globals()[f'case_{args.case}'](inventory, args)
+    print(json.dumps({
+        'metrics': metrics,
+        'wall_seconds': time.perf_counter() - start,
+        'peak_rss_mb': peak_rss_mb(resource.RUSAGE_SELF),
+        'children_peak_rss_mb': peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }))
+
+
+def seed_database(path, items):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}')
+    code = ('import synthetic, inventory_auth_app as inventory; '
+            f'synthetic.seed_items(inventory, {items})')
+    subprocess.run([sys.executable, '-c', code], cwd=os.path.join(ROOT, 'benchmarks'), env=env,
+                   check=True, stdout=subprocess.DEVNULL)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def is_timing(key):
+    return key.endswith(('_ms', 'seconds')) or key.startswith('ms_') or '_ms_' in key
+
+
+def compare(results, previous_path, max_slowdown, max_rss_growth):
+    """Print how every timing and peak RSS changed, returns the ones past their threshold (percent)"""
+    with open(previous_path) as f:
+        previous = json.load(f)
+    before = {(r['items'], r['case']): r for r in previous['results'] if 'metrics' in r}
+    regressions = []
+    print(f'\nCompared with {previous.get("commit")} ({previous_path}), + is slower or bigger')
+    for result in results:
+        old = before.get((result['items'], result['case']))
+        if not old or 'metrics' not in result:
+            continue
+        changes = [(key, old['metrics'].get(key), value, max_slowdown)
+                   for key, value in result['metrics'].items() if is_timing(key)]
+        changes += [(key, old.get(key), result.get(key), max_rss_growth) for key in RSS_KEYS]
+        for key, old_value, value, threshold in changes:
+            if not old_value or value is None:
+                continue
+            change = (value - old_value) / old_value * 100
+            flag = ''
+            if change > threshold:
+                regressions.append((result['items'], result['case'], key, change))
+                flag = '  REGRESSION'
+            print(f'{result["items"]:>8} {result["case"]:<18} {key:<22} {old_value:>10.2f} -> {value:>10.2f} '
+                  f'{change:+6.1f}%{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', default='1000,10000', help='inventory sizes, comma separated')
+    parser.add_argument('--cases', default=','.join(CASES), help='cases to run, comma separated')
+    parser.add_argument('--export-limit', type=int, default=2000,
+                        help='items rendered by the export cases, 0 for the whole inventory')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='JSON results file (default benchmarks/results/<time>_<commit>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare with')
+    parser.add_argument('--max-slowdown', type=float, default=20,
+                        help='percent a timing may grow before --compare fails')
+    parser.add_argument('--max-rss-growth', type=float, default=10,
+                        help='percent a peak RSS may grow before --compare fails')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        args.items = int(args.items)
+        run_case(args)
+        return
+
+    sizes = [int(size) for size in args.items.split(',')]
+    cases = [case for case in args.cases.split(',') if case]
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        parser.error(f'unknown cases: {", ".join(unknown)}')
+
+    commit = git_commit()
+    results = []
+    for size in sizes:
+        fd, db_path = tempfile.mkstemp(prefix='inventory_bench_', suffix='.db')
+        os.close(fd)
+        cache_dir = tempfile.mkdtemp(prefix='inventory_bench_cache_')
+        try:
+            start = time.perf_counter()
+            seed_database(db_path, size)
+            print(f'{size} items seeded in {time.perf_counter() - start:.1f}s')
+
+            env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}',
+                       QR_LABEL_CACHE_DIR=os.path.join(cache_dir, 'labels'),
+                       QR_SHEET_CACHE_DIR=os.path.join(cache_dir, 'sheets'))
+            for case in cases:
+                command = [sys.executable, os.path.abspath(__file__), '--case', case, '--items', str(size),
+                           '--export-limit', str(args.export_limit), '--repeat', str(args.repeat)]
+                child = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+                result = {'items': size, 'case': case}
+                if child.returncode == 0:
+                    result.update(json.loads(child.stdout.strip().splitlines()[-1]))
+                    metrics = ', '.join(f'{k}={v:.2f}' if isinstance(v, float) else f'{k}={v}'
+                                        for k, v in result['metrics'].items())
+                    print(f'  {case:<18} {metrics}  rss={result["peak_rss_mb"]:.0f}MB')
+                else:
+                    result['error'] = child.stderr.strip().splitlines()[-1] if child.stderr.strip() else 'failed'
+                    print(f'  {case:<18} ERROR {result["error"]}')
+                results.append(result)
+        finally:
+            os.remove(db_path)
+            subprocess.run(['rm', '-rf', cache_dir])
+
+    report = {
+        'commit': commit,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'export_limit': args.export_limit,
+        'repeat': args.repeat,
+        'results': results,
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f'{datetime.now():%Y%m%d_%H%M%S}_{commit or "unknown"}.json')
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {output}')
+
+    regressions = []
+    if args.compare:
+        regressions = compare(results, args.compare, args.max_slowdown, args.max_rss_growth)
+        if regressions:
+            print(f'{len(regressions)} regression{"" if len(regressions) == 1 else "s"} past the thresholds')
+
+    if regressions or any('error' in result for result in results):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Synthetic SQLite inventories for the benchmarks.
+
+Import this before the app: it points DATABASE_URL at a throwaway SQLite
+file unless one is already set.
+"""
+import atexit
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+if 'DATABASE_URL' not in os.environ:
+    fd, DB_PATH = tempfile.mkstemp(prefix='inventory_bench_', suffix='.db')
+    os.close(fd)
+    atexit.register(os.remove, DB_PATH)
+    os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+
+CATEGORIES = ['Tools', 'Electronics', 'Furniture', 'Office', 'Cleaning', 'Safety', 'Parts', 'Cables']
+STATUSES = ['available', 'in-use', 'maintenance', 'retired']
+LOCATIONS = [f'Warehouse {w} / Shelf {s}' for w in 'ABCD' for s in range(1, 26)]
+WORDS = ['drill', 'cable', 'monitor', 'chair', 'ladder', 'gloves', 'router', 'battery',
+         'bracket', 'scanner', 'printer', 'helmet', 'adapter', 'switch', 'bolt', 'valve']
+
+
+def seed_items(app_module, count, seed=42, batch_size=5000):
+    """Fill the app database with count random items (skipped if already there)"""
+    db, Item = app_module.db, app_module.Item
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+
+    with app_module.app.app_context():
+        # The app no longer creates its tables on import
+        app_module.upgrade_database()
+        existing = db.session.query(Item.id).count()
+        rows = []
+        for i in range(existing, count):
+            created_at = start + timedelta(minutes=i)
+            name = ' '.join(rng.choice(WORDS) for _ in range(3)).title()
+            rows.append({
+                'code': f'S{i:07d}',
+                'name': f'{name} {i}',
+                'description': ' '.join(rng.choice(WORDS) for _ in range(12)),
+                'category': rng.choice(CATEGORIES),
+                'location': rng.choice(LOCATIONS),
+                'quantity': rng.randint(0, 500),
+                'status': rng.choice(STATUSES),
+                'created_at': created_at,
+                'updated_at': created_at + timedelta(hours=rng.randint(0, 5000)),
+            })
+            if len(rows) == batch_size:
+                db.session.execute(Item.__table__.insert(), rows)
+                rows = []
+        if rows:
+            db.session.execute(Item.__table__.insert(), rows)
+        db.session.commit()
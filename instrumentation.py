@@ -0,0 +1,233 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+import hmac
+import os
+import threading
+import time
+
+from flask import Response, abort, request
+from sqlalchemy import event
+
+# Request latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# SQL statements per request, N+1 queries end up in the top buckets
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 500)
+# When set, /metrics requires an "Authorization: Bearer <token>" header
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# Endpoint label of work done outside a request (background jobs, CLI commands)
+BACKGROUND = 'background'
+
+# name: (type, help, histogram buckets)
+METRIC_TYPES = {
+    'http_requests_total': ('counter', 'Requests by endpoint, method and status', None),
+    'http_request_duration_seconds': ('histogram', 'Request time including streamed bodies', LATENCY_BUCKETS),
+    'http_request_sql_queries': ('histogram', 'SQL statements per request', QUERY_COUNT_BUCKETS),
+    'sql_queries_total': ('counter', 'SQL statements by endpoint', None),
+    'sql_query_seconds_total': ('counter', 'Time spent in SQL statements by endpoint', None),
+    'render_stage_calls_total': ('counter', 'Label render calls by stage and endpoint', None),
+    'render_stage_seconds_total': ('counter', 'Time spent in QR encoding, drawing, PNG encoding, '
+                                   'ZIP compression and PDF drawing by endpoint', None),
+}
+
+class Metrics:
+    """Process-wide counters and histograms rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {name: {} for name in METRIC_TYPES}
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            series = self._series[name]
+            series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name, labels, value):
+        buckets = METRIC_TYPES[name][2]
+        with self._lock:
+            series = self._series[name]
+            histogram = series.get(labels)
+            if histogram is None:
+                # [count per bucket, sum, count]
+                histogram = series[labels] = [[0] * len(buckets), 0, 0]
+            index = bisect_left(buckets, value)
+            if index < len(buckets):
+                histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, buckets) in METRIC_TYPES.items():
+                series = self._series[name]
+                if not series:
+                    continue
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in series.items():
+                    if kind == 'counter':
+                        lines.append(f'{name}{_format_labels(labels)} {_format_number(value)}')
+                        continue
+                    counts, total, count = value
+                    cumulative = 0
+                    for bound, bucket_count in zip(buckets, counts):
+                        cumulative += bucket_count
+                        bucket_labels = labels + (('le', _format_number(bound)),)
+                        lines.append(f'{name}_bucket{_format_labels(bucket_labels)} {cumulative}')
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {count}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {_format_number(total)}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape_label(value)}"' for key, value in labels) + '}'
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+metrics = Metrics()
+
+class RequestStats:
+    """SQL and render stage totals of one request"""
+
+    def __init__(self, endpoint=None):
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.stages = {}
+
+    def add_stage(self, name, seconds, calls=1):
+        total = self.stages.setdefault(name, [0.0, 0])
+        total[0] += seconds
+        total[1] += calls
+
+_current_stats = ContextVar('request_stats', default=None)
+
+def record_stage(name, seconds, calls=1):
+    """Add time spent in a render stage to the current request and the process totals"""
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.add_stage(name, seconds, calls)
+        if stats.endpoint is None:
+            # Collected in a render worker, the process that reads the result reports it
+            return
+    labels = (('stage', name), ('endpoint', stats.endpoint if stats else BACKGROUND))
+    metrics.inc('render_stage_calls_total', labels, calls)
+    metrics.inc('render_stage_seconds_total', labels, seconds)
+
+def add_stages(stages):
+    """Report stage totals collected elsewhere, e.g. by collect_stages in a render worker"""
+    for name, (seconds, calls) in stages.items():
+        record_stage(name, seconds, calls)
+
+@contextmanager
+def collect_stages():
+    """Collect render stage times here instead of reporting them, yields the RequestStats"""
+    stats = RequestStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as render stage name"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+def timed(name):
+    """Decorator timing every call of a function as render stage name"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record_stage(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['query_start'].pop()
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.sql_count += 1
+        stats.sql_seconds += seconds
+    labels = (('endpoint', stats.endpoint if stats and stats.endpoint else BACKGROUND),)
+    metrics.inc('sql_queries_total', labels)
+    metrics.inc('sql_query_seconds_total', labels, seconds)
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute
+    if context.connection is not None and context.connection.info.get('query_start'):
+        context.connection.info['query_start'].pop()
+
+def server_timing(stats):
+    """Server-Timing header value: total, SQL and every render stage so far, in milliseconds"""
+    parts = [f'app;dur={(time.perf_counter() - stats.start) * 1000:.1f}',
+             f'db;dur={stats.sql_seconds * 1000:.1f};desc="{stats.sql_count} queries"']
+    for name, (seconds, calls) in stats.stages.items():
+        parts.append(f'{name};dur={seconds * 1000:.1f};desc="{calls} calls"')
+    return ', '.join(parts)
+
+def after_response(response, func):
+    """Call func once the response body is sent, streamed bodies included"""
+    if response.direct_passthrough:
+        # send_file bodies go to the server's file wrapper, which skips the close callbacks
+        func()
+    else:
+        response.call_on_close(func)
+
+def _start_request():
+    _current_stats.set(RequestStats(request.endpoint or 'unmatched'))
+
+def _finish_request(response):
+    stats = _current_stats.get()
+    if stats is None or stats.endpoint is None:
+        return response
+    # Streamed bodies (ZIP exports) are still to be rendered, the header only covers the work so far
+    response.headers['Server-Timing'] = server_timing(stats)
+    method, status = request.method, str(response.status_code)
+
+    def observe():
+        endpoint = (('endpoint', stats.endpoint),)
+        metrics.inc('http_requests_total', endpoint + (('method', method), ('status', status)))
+        metrics.observe('http_request_duration_seconds', endpoint, time.perf_counter() - stats.start)
+        metrics.observe('http_request_sql_queries', endpoint, stats.sql_count)
+
+    after_response(response, observe)
+    return response
+
+def metrics_view():
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get('Authorization', ''),
+                                                 f'Bearer {METRICS_TOKEN}'):
+        abort(401)
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def init_app(app, db=None):
+    """Time every request of app and its SQL statements, and serve the totals at /metrics"""
+    if db is not None:
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(engine, 'handle_error', _handle_error)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
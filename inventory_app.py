@@ -1,14 +1,19 @@
 from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import load_only
 from datetime import datetime
 import qrcode
-from PIL import Image
-import os
 import io
 import base64
 import string
 import random
 
+import item_api
+import label_assets
+from item_search import ItemSearch
+import instrumentation
+from instrumentation import stage
+
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///inventory.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -29,19 +34,22 @@ class Item(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'code': self.code,
-            'name': self.name,
-            'description': self.description,
-            'category': self.category,
-            'location': self.location,
-            'quantity': self.quantity,
-            'status': self.status,
-            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S')
-        }
+    def to_dict(self, fields=None):
+        data = {}
+        for field in fields or ITEM_API_FIELDS:
+            value = getattr(self, field)
+            if field in ('created_at', 'updated_at'):
+                value = value.strftime('%Y-%m-%d %H:%M:%S') if value else None
+            data[field] = value
+        return data
+
+item_search = ItemSearch(db, Item)
+# Per-endpoint latency, SQL and render timings at /metrics and in Server-Timing headers
+instrumentation.init_app(app, db)
+
+# Fields served by the API, in response order
+ITEM_API_FIELDS = ['id', 'code', 'name', 'description', 'category', 'location', 'quantity',
+                   'status', 'created_at', 'updated_at']
 
 def generate_item_code():
     """Generate a unique item code"""
@@ -63,46 +71,45 @@ def generate_qr_code_image(item_code, item_name):
     base_url = request.host_url.rstrip('/')
     item_url = f"{base_url}/item/{item_code}"
     
-    qr.add_data(item_url)
-    qr.make(fit=True)
-    
-    qr_image = qr.make_image(fill_color="black", back_color="white").convert('RGB')
+    with stage('qr_encode'):
+        qr.add_data(item_url)
+        qr.make(fit=True)
     
-    # Try to add logo if exists
-    try:
-        logo_path = os.path.join(os.getcwd(), '02.jpg')
-        if os.path.exists(logo_path):
-            logo = Image.open(logo_path)
-            logo_size = (60, 60)
-            logo_resized = logo.resize(logo_size)
-            
+    with stage('draw'):
+        qr_image = qr.make_image(fill_color="black", back_color="white").convert('RGB')
+        
+        # Add the logo if there is one, decoded and resized once per process
+        logo_resized = label_assets.get_logo((60, 60))
+        if logo_resized is not None:
             logo_x = (qr_image.size[0] - logo_resized.size[0]) // 2
             logo_y = (qr_image.size[1] - logo_resized.size[1]) // 2
             
             qr_image.paste(logo_resized, (logo_x, logo_y))
-    except Exception as e:
-        print(f'Logo error: {e}')
     
     return qr_image
 
+def apply_item_filters(query, args, ranked=False):
+    """Apply the index page filters (search, category) to an Item query.
+
+    With ranked, search results come best match first.
+    """
+    search = args.get('search', '')
+    category = args.get('category', '')
+    
+    if search:
+        query = item_search.apply(query, search, ranked=ranked)
+    
+    if category:
+        query = query.filter(Item.category == category)
+    
+    return query
+
 @app.route('/')
 def index():
     search = request.args.get('search', '')
     category = request.args.get('category', '')
     
-    query = Item.query
-    
-    if search:
-        query = query.filter(
-            db.or_(
-                Item.name.contains(search),
-                Item.code.contains(search),
-                Item.description.contains(search)
-            )
-        )
-    
-    if category:
-        query = query.filter_by(category=category)
+    query = apply_item_filters(Item.query, request.args, ranked=True)
     
     items = query.order_by(Item.created_at.desc()).all()
     categories = db.session.query(Item.category).distinct().all()
@@ -178,7 +185,8 @@ def generate_qr(code):
     qr_image = generate_qr_code_image(item.code, item.name)
     
     buffered = io.BytesIO()
-    qr_image.save(buffered, format="PNG")
+    with stage('png_encode'):
+        qr_image.save(buffered, format="PNG")
     buffered.seek(0)
     
     return send_file(buffered, mimetype='image/png', 
@@ -187,8 +195,54 @@ def generate_qr(code):
 
 @app.route('/api/items')
 def api_items():
-    items = Item.query.all()
-    return jsonify([item.to_dict() for item in items])
+    """Items page by page, ordered by (updated_at, id).
+
+    Query args: cursor (from next_cursor), limit, fields=a,b,c and the
+    index page filters.
+    """
+    try:
+        position = item_api.decode_cursor(request.args.get('cursor'))
+        limit = item_api.parse_limit(request.args.get('limit'))
+        fields = item_api.parse_fields(request.args.get('fields'), ITEM_API_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Load only requested columns, id and updated_at are needed for the cursor
+    columns = {'id', 'updated_at'} | set(fields)
+    query = Item.query.options(load_only(*[getattr(Item, c) for c in columns]))
+    query = apply_item_filters(query, request.args)
+
+    items, next_cursor = item_api.keyset_page(query, Item, position, limit)
+
+    return jsonify({
+        'items': [item.to_dict(fields) for item in items],
+        'next_cursor': next_cursor,
+        'limit': limit
+    })
+
+@app.route('/api/items/lookup', methods=['POST'])
+def api_items_lookup():
+    """Resolve many item codes in one request, e.g. a pallet read by a scanner.
+
+    JSON body {"codes": [...]}, optional ?fields=a,b,c as for /api/items.
+    Answers {"items": {code: item}, "missing": [codes not found]}.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        codes = item_api.parse_codes(item_api.body_value(data, 'codes'))
+        fields = item_api.parse_fields(request.args.get('fields'), ITEM_API_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    columns = {'code'} | set(fields)
+    query = Item.query.options(load_only(*[getattr(Item, c) for c in columns]))
+    items = query.filter(Item.code.in_(codes)).all() if codes else []
+
+    found = {item.code: item.to_dict(fields) for item in items}
+    return jsonify({
+        'items': found,
+        'missing': [code for code in codes if code not in found]
+    })
 
 @app.route('/api/item/<code>')
 def api_item(code):
@@ -198,6 +252,7 @@ def api_item(code):
 # Create tables
 with app.app_context():
     db.create_all()
+    item_search.setup()
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=8080)
\ No newline at end of file
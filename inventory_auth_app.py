@@ -1,19 +1,41 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file, session, flash
+from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file, session, flash, Response, stream_with_context, abort
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, update, inspect, text
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+from sqlalchemy.orm import load_only, joinedload
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from authlib.integrations.flask_client import OAuth
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
-import qrcode
-from PIL import Image, ImageDraw, ImageFont
 import os
 import io
 import base64
 import string
 import random
 import json
-import zipfile
+import tempfile
+from collections import deque
+from itertools import islice
 from dotenv import load_dotenv
+import click
+from zip_stream import stream_zip
+from label_render import (item_url, build_qr_matrix, render_plain_qr, render_label, render_sheet_cell,
+                          render_a4_sheet, encode_png, ITEMS_PER_SHEET)
+import render_pool
+import label_cache
+from label_pdf import write_label_sheets
+import item_api
+from item_search import ItemSearch
+from facets import FacetCounts
+import item_import
+from item_import import ItemImporter
+from item_export import stream_csv, stream_ndjson
+from jobs import job_queue
+from response_cache import response_cache, make_etag, http_last_modified, is_not_modified
+from stock_ledger import StockLedger
+import instrumentation
+import profiling
+from render_pool import render_item_task, render_cell_task, render_sheet_task, cell_from_bytes
 
 # Load environment variables from .env file
 load_dotenv()
@@ -27,6 +49,27 @@ def to_local_time(utc_dt):
         return pytz.utc.localize(utc_dt).astimezone(TIMEZONE)
     return None
 
+# Asia/Bangkok has no DST, one offset formats every timestamp in bulk output
+LOCAL_UTC_OFFSET = TIMEZONE.utcoffset(datetime(2000, 1, 1))
+
+def format_local_timestamp(utc_dt):
+    """Format a UTC datetime as local time without a per-row pytz conversion"""
+    if utc_dt:
+        return (utc_dt + LOCAL_UTC_OFFSET).strftime('%Y-%m-%d %H:%M:%S GMT+7')
+    return None
+
+def parse_local_timestamp(value):
+    """UTC datetime from an ISO date or date-time, local time unless it has an offset.
+
+    A bare date means the end of that day. Raises ValueError.
+    """
+    parsed = datetime.fromisoformat(value)
+    if len(value) == 10:
+        parsed += timedelta(days=1, microseconds=-1)
+    if parsed.tzinfo:
+        return parsed.astimezone(pytz.utc).replace(tzinfo=None)
+    return parsed - LOCAL_UTC_OFFSET
+
 app = Flask(__name__)
 
 # Add timezone filter for templates
@@ -74,6 +117,20 @@ github = oauth.register(
     client_kwargs={'scope': 'user:email'},
 )
 
+# Item cards rendered per index page / infinite scroll fetch
+ITEMS_PER_PAGE = 48
+
+# Bulk QR export settings
+QR_EXPORT_CHUNK_SIZE = int(os.environ.get('QR_EXPORT_CHUNK_SIZE', 200))
+# Rows fetched per round trip by the CSV / NDJSON exports
+ITEM_EXPORT_CHUNK_SIZE = int(os.environ.get('ITEM_EXPORT_CHUNK_SIZE', 1000))
+
+# Changes newer than this are held back from sync clients until their transaction has surely committed
+SYNC_LAG = timedelta(seconds=2)
+
+# Pending labels listed on the print queue page, the downloads include all of them
+PRINT_QUEUE_PREVIEW = 200
+
 # Whitelist of allowed GitHub usernames
 ALLOWED_USERS = ['RealNattawattHongthong']
 
@@ -86,6 +143,10 @@ class User(UserMixin, db.Model):
     avatar_url = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+def created_at_default(context):
+    """The row's own created_at, so a label never changed since has label_changed_at == created_at"""
+    return context.get_current_parameters()['created_at']
+
 class Item(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     code = db.Column(db.String(20), unique=True, nullable=False)
@@ -97,24 +158,131 @@ class Item(db.Model):
     status = db.Column(db.String(50), default='available')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Last change of what is printed on the label (code, name), stock changes leave it alone
+    label_changed_at = db.Column(db.DateTime, default=created_at_default)
     created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     created_by = db.relationship('User', backref='items')
     
+    # Match the index page (filter on one facet, newest first), the API (updated_at, id) cursor
+    # and the print queue
+    __table_args__ = (
+        db.Index('ix_item_created_at', 'created_at'),
+        db.Index('ix_item_category_created_at', 'category', 'created_at'),
+        db.Index('ix_item_status_created_at', 'status', 'created_at'),
+        db.Index('ix_item_location_created_at', 'location', 'created_at'),
+        db.Index('ix_item_updated_at_id', 'updated_at', 'id'),
+        db.Index('ix_item_label_changed_at_id', 'label_changed_at', 'id'),
+    )
+    
+    def to_dict(self, fields=None):
+        data = {}
+        for field in fields or ITEM_API_FIELDS:
+            if field in ('created_at', 'updated_at'):
+                data[field] = format_local_timestamp(getattr(self, field))
+            elif field == 'created_by':
+                data[field] = self.created_by.username if self.created_by else None
+            else:
+                data[field] = getattr(self, field)
+        return data
+
+class ItemTombstone(db.Model):
+    """A deleted item, kept so sync clients can drop it"""
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, nullable=False)
+    code = db.Column(db.String(20), nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.item_id,
+            'code': self.code,
+            'deleted_at': format_local_timestamp(self.deleted_at)
+        }
+
+class StockMovement(db.Model):
+    """One change of an item's quantity, status or location. Rows are only ever added"""
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, nullable=False)
+    code = db.Column(db.String(20), nullable=False)
+    reason = db.Column(db.String(20), nullable=False)  # add, edit, adjust, import or delete
+    delta = db.Column(db.Integer, nullable=False, default=0)
+    # Quantity after the movement, status and location before and after it
+    quantity = db.Column(db.Integer)
+    from_status = db.Column(db.String(50))
+    to_status = db.Column(db.String(50))
+    from_location = db.Column(db.String(200))
+    to_location = db.Column(db.String(200))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    user = db.relationship('User')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    # Time-range scans overall, per item and per location
+    __table_args__ = (
+        db.Index('ix_stock_movement_created_at_id', 'created_at', 'id'),
+        db.Index('ix_stock_movement_item_created_at', 'item_id', 'created_at'),
+        db.Index('ix_stock_movement_from_location_created_at', 'from_location', 'created_at'),
+        db.Index('ix_stock_movement_to_location_created_at', 'to_location', 'created_at'),
+    )
+    
     def to_dict(self):
         return {
-            'id': self.id,
             'code': self.code,
-            'name': self.name,
-            'description': self.description,
-            'category': self.category,
-            'location': self.location,
+            'reason': self.reason,
+            'delta': self.delta,
             'quantity': self.quantity,
-            'status': self.status,
-            'created_at': to_local_time(self.created_at).strftime('%Y-%m-%d %H:%M:%S GMT+7') if self.created_at else None,
-            'updated_at': to_local_time(self.updated_at).strftime('%Y-%m-%d %H:%M:%S GMT+7') if self.updated_at else None,
-            'created_by': self.created_by.username if self.created_by else None
+            'from_status': self.from_status,
+            'to_status': self.to_status,
+            'from_location': self.from_location,
+            'to_location': self.to_location,
+            'user': self.user.username if self.user else None,
+            'created_at': format_local_timestamp(self.created_at)
         }
 
+class StockSnapshot(db.Model):
+    """Quantity, status and location of every item at taken_at"""
+    id = db.Column(db.Integer, primary_key=True)
+    taken_at = db.Column(db.DateTime, nullable=False)
+    item_id = db.Column(db.Integer, nullable=False)
+    code = db.Column(db.String(20), nullable=False)
+    quantity = db.Column(db.Integer)
+    status = db.Column(db.String(50))
+    location = db.Column(db.String(200))
+    
+    __table_args__ = (
+        db.Index('ix_stock_snapshot_taken_at_location', 'taken_at', 'location'),
+    )
+
+class PrintMark(db.Model):
+    """A user's last print run: items changed after printed_until still need labels"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True, nullable=False)
+    printed_until = db.Column(db.DateTime, nullable=False)
+    marked_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+item_search = ItemSearch(db, Item)
+stock_ledger = StockLedger(db, Item, StockMovement, StockSnapshot)
+facet_counts = FacetCounts(db, Item)
+# Per-endpoint latency, SQL and render timings at /metrics and in Server-Timing headers
+instrumentation.init_app(app, db)
+# Single request profiles (?profile=1) for allowed users, only with PROFILING_ENABLED set
+profiling.init_app(app, lambda: current_user.is_authenticated and current_user.username in ALLOWED_USERS)
+
+def record_imported_items(mappings):
+    """Ledger movements for a chunk of imported items, before it is committed"""
+    ids = dict(db.session.query(Item.code, Item.id).filter(Item.code.in_([m['code'] for m in mappings])))
+    stock_ledger.record([
+        stock_ledger.movement_values(ids[m['code']], m['code'], 'import', m['created_by_id'],
+                                     delta=m['quantity'], quantity=m['quantity'],
+                                     to_status=m['status'], to_location=m['location'])
+        for m in mappings
+    ])
+
+item_importer = ItemImporter(db, Item, after_insert=record_imported_items)
+
+# Fields served by the API, in response order
+ITEM_API_FIELDS = ['id', 'code', 'name', 'description', 'category', 'location', 'quantity',
+                   'status', 'created_at', 'updated_at', 'created_by']
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
@@ -128,103 +296,38 @@ def generate_item_code():
 
 def generate_qr_code_image(item_code, item_name, with_label=False):
     """Generate QR code for an item with optional label"""
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=10,
-        border=4,
-    )
-
-    # Create URL for item detail page
     base_url = request.host_url.rstrip('/')
-    item_url = f"{base_url}/item/{item_code}"
-
-    qr.add_data(item_url)
-    qr.make(fit=True)
-
-    qr_image = qr.make_image(fill_color="black", back_color="white").convert('RGB')
-
-    # Try to add logo if exists
-    try:
-        logo_path = os.path.join(os.getcwd(), '02.jpg')
-        if os.path.exists(logo_path):
-            logo = Image.open(logo_path)
-            logo_size = (60, 60)
-            logo_resized = logo.resize(logo_size)
-
-            logo_x = (qr_image.size[0] - logo_resized.size[0]) // 2
-            logo_y = (qr_image.size[1] - logo_resized.size[1]) // 2
-
-            qr_image.paste(logo_resized, (logo_x, logo_y))
-    except Exception as e:
-        print(f'Logo error: {e}')
+    matrix = build_qr_matrix(item_url(base_url, item_code))
 
     if not with_label:
-        return qr_image
+        return render_plain_qr(matrix)
 
-    # Create 3x5 cm image with QR code and label
-    # 3x5 cm at 300 DPI = 354x590 pixels
-    canvas_width = 354
-    canvas_height = 590
+    # 3x5 cm label with QR code, code and name
+    return render_label(matrix, item_code, item_name)
 
-    # Create canvas
-    canvas = Image.new('RGB', (canvas_width, canvas_height), 'white')
+def apply_item_filters(query, args, ranked=False):
+    """Apply the index page filters (search, category, status, location) to an Item query.
 
-    # Make QR code smaller to leave more space for larger text
-    qr_size = min(canvas_width - 80, 240)  # Smaller QR code (was canvas_height - 120)
-    qr_resized = qr_image.resize((qr_size, qr_size), Image.Resampling.LANCZOS)
-
-    # Center QR code horizontally and place it in upper portion
-    qr_x = (canvas_width - qr_size) // 2
-    qr_y = 30
-    canvas.paste(qr_resized, (qr_x, qr_y))
-
-    # Add text labels
-    draw = ImageDraw.Draw(canvas)
-
-    # Much larger fonts for better readability
-    try:
-        font_large = ImageFont.truetype("Arial.ttf", 32)  # Increased from 20
-        font_small = ImageFont.truetype("Arial.ttf", 24)  # Increased from 16
-    except:
-        try:
-            # Try system fonts on different platforms
-            font_large = ImageFont.truetype("/System/Library/Fonts/Arial.ttf", 32)
-            font_small = ImageFont.truetype("/System/Library/Fonts/Arial.ttf", 24)
-        except:
-            try:
-                font_large = ImageFont.load_default()
-                font_small = ImageFont.load_default()
-            except:
-                font_large = None
-                font_small = None
-
-    # Add item code with more space
-    text_y = qr_y + qr_size + 40  # More spacing
-    code_text = f"Code: {item_code}"
-    if font_large:
-        bbox = draw.textbbox((0, 0), code_text, font=font_large)
-        text_width = bbox[2] - bbox[0]
-        text_x = (canvas_width - text_width) // 2
-        draw.text((text_x, text_y), code_text, fill='black', font=font_large)
-    else:
-        draw.text((20, text_y), code_text, fill='black')
-
-    # Add item name with more space (wrap if too long)
-    text_y += 50  # More spacing between code and name
-    name_text = item_name
-    if len(name_text) > 25:  # Shorter line length for larger text
-        name_text = name_text[:22] + "..."
-
-    if font_small:
-        bbox = draw.textbbox((0, 0), name_text, font=font_small)
-        text_width = bbox[2] - bbox[0]
-        text_x = (canvas_width - text_width) // 2
-        draw.text((text_x, text_y), name_text, fill='black', font=font_small)
-    else:
-        draw.text((20, text_y), name_text, fill='black')
-
-    return canvas
+    With ranked, search results come best match first.
+    """
+    search = args.get('search', '')
+    category = args.get('category', '')
+    status = args.get('status', '')
+    location = args.get('location', '')
+    
+    if search:
+        query = item_search.apply(query, search, ranked=ranked)
+    
+    if category:
+        query = query.filter(Item.category == category)
+    
+    if status:
+        query = query.filter(Item.status == status)
+    
+    if location:
+        query = query.filter(Item.location == location)
+    
+    return query
 
 # Auth Routes
 @app.route('/login')
@@ -279,55 +382,104 @@ def logout():
     return redirect(url_for('index'))
 
 # Public Routes
+def index_page_items(args, page):
+    """One page of index cards, with created_by loaded in the same query"""
+    query = apply_item_filters(Item.query.options(joinedload(Item.created_by)), args, ranked=True)
+    rows = (query.order_by(Item.created_at.desc(), Item.id.desc())
+            .offset((page - 1) * ITEMS_PER_PAGE)
+            .limit(ITEMS_PER_PAGE + 1)
+            .all())
+    next_page = page + 1 if len(rows) > ITEMS_PER_PAGE else None
+    return rows[:ITEMS_PER_PAGE], next_page
+
+def index_filters(args):
+    """Active index filters, carried over to next-page URLs"""
+    return {key: args[key] for key in ('search', 'category', 'status', 'location') if args.get(key)}
+
 @app.route('/')
 def index():
     search = request.args.get('search', '')
     category = request.args.get('category', '')
     status = request.args.get('status', '')
     location = request.args.get('location', '')
+    page = max(request.args.get('page', 1, type=int), 1)
     
-    query = Item.query
-    
-    if search:
-        query = query.filter(
-            db.or_(
-                Item.name.contains(search),
-                Item.code.contains(search),
-                Item.description.contains(search)
-            )
-        )
-    
-    if category:
-        query = query.filter_by(category=category)
-    
-    if status:
-        query = query.filter_by(status=status)
-    
-    if location:
-        query = query.filter_by(location=location)
-    
-    items = query.order_by(Item.created_at.desc()).all()
-    categories = db.session.query(Item.category).distinct().all()
-    categories = [c[0] for c in categories if c[0]]
-    statuses = db.session.query(Item.status).distinct().all()
-    statuses = [s[0] for s in statuses if s[0]]
-    locations = db.session.query(Item.location).distinct().all()
-    locations = [l[0] for l in locations if l[0]]
+    items, next_page = index_page_items(request.args, page)
+    counts = facet_counts.get()
     
     return render_template('inventory_auth_index.html', 
                          items=items, 
+                         next_page=next_page,
+                         filters=index_filters(request.args),
                          search=search, 
-                         categories=categories,
+                         categories=counts['category'],
                          selected_category=category,
-                         statuses=statuses,
+                         statuses=counts['status'],
                          selected_status=status,
-                         locations=locations,
+                         locations=counts['location'],
                          selected_location=location)
 
+@app.route('/items/fragment')
+def items_fragment():
+    """Next page of index cards as an HTML fragment, for infinite scroll"""
+    page = max(request.args.get('page', 2, type=int), 1)
+    items, next_page = index_page_items(request.args, page)
+    filters = index_filters(request.args)
+    
+    return jsonify({
+        'html': render_template('_item_cards.html', items=items),
+        'next_url': url_for('items_fragment', page=next_page, **filters) if next_page else None,
+        'next_page_url': url_for('index', page=next_page, **filters) if next_page else None
+    })
+
+def cached_item_response(kind, code, variant, render, mimetype):
+    """Single-item response answered from ETag / Last-Modified or the response cache.
+
+    Only the item's updated_at is read up front. The item is loaded and
+    render(item) run only when neither the client nor the cache has the
+    current version.
+    """
+    row = db.session.query(Item.updated_at).filter(Item.code == code).first()
+    if row is None:
+        abort(404)
+
+    version = row.updated_at
+    etag = make_etag(kind, code, version.isoformat(), variant)
+    if is_not_modified(request, etag, http_last_modified(version)):
+        response = Response(status=304)
+    else:
+        body = response_cache.get(kind, code, variant, version.isoformat())
+        if body is None:
+            item = Item.query.options(joinedload(Item.created_by)).filter_by(code=code).first_or_404()
+            # The item may have changed since its version was read
+            if item.updated_at != version:
+                version = item.updated_at
+                etag = make_etag(kind, code, version.isoformat(), variant)
+            body = render(item)
+            response_cache.set(kind, code, variant, version.isoformat(), body)
+        response = Response(body, mimetype=mimetype)
+
+    response.set_etag(etag)
+    response.last_modified = http_last_modified(version)
+    # Clients may keep the response but must revalidate it on every scan
+    response.cache_control.no_cache = True
+    return response
+
 @app.route('/item/<code>')
 def item_detail(code):
-    item = Item.query.filter_by(code=code).first_or_404()
-    return render_template('item_auth_detail.html', item=item)
+    # Pending flash messages are shown once, never cache a page holding them
+    if session.get('_flashes'):
+        item = Item.query.filter_by(code=code).first_or_404()
+        return render_template('item_auth_detail.html', item=item)
+
+    # The page shows edit controls and the user's name when logged in
+    variant = current_user.get_id() if current_user.is_authenticated else 'anonymous'
+    response = cached_item_response('page', code, variant,
+                                    lambda item: render_template('item_auth_detail.html', item=item),
+                                    'text/html')
+    if current_user.is_authenticated:
+        response.cache_control.private = True
+    return response
 
 # Protected Routes
 @app.route('/add', methods=['GET', 'POST'])
@@ -352,7 +504,12 @@ def add_item():
         )
         
         db.session.add(item)
+        db.session.flush()
+        stock_ledger.record([stock_ledger.movement_values(
+            item.id, item.code, 'add', current_user.id, delta=item.quantity, quantity=item.quantity,
+            to_status=item.status, to_location=item.location)])
         db.session.commit()
+        facet_counts.invalidate()
         
         return redirect(url_for('item_detail', code=item.code))
     
@@ -364,6 +521,8 @@ def edit_item(code):
     item = Item.query.filter_by(code=code).first_or_404()
     
     if request.method == 'POST':
+        old_name = item.name
+        old_quantity, old_status, old_location = item.quantity, item.status, item.location
         item.name = request.form.get('name')
         item.description = request.form.get('description')
         item.category = request.form.get('category')
@@ -371,8 +530,22 @@ def edit_item(code):
         item.quantity = int(request.form.get('quantity', 1))
         item.status = request.form.get('status')
         item.updated_at = datetime.utcnow()
+        if item.name != old_name:
+            item.label_changed_at = item.updated_at
+        
+        if (item.quantity, item.status, item.location) != (old_quantity, old_status, old_location):
+            stock_ledger.record([stock_ledger.movement_values(
+                item.id, item.code, 'edit', current_user.id,
+                delta=(item.quantity or 0) - (old_quantity or 0), quantity=item.quantity,
+                from_status=old_status, to_status=item.status,
+                from_location=old_location, to_location=item.location)])
         
         db.session.commit()
+        facet_counts.invalidate()
+        response_cache.invalidate(code)
+        
+        if item.name != old_name:
+            label_cache.invalidate_item(item.code)
         
         return redirect(url_for('item_detail', code=item.code))
     
@@ -382,214 +555,689 @@ def edit_item(code):
 @login_required
 def delete_item(code):
     item = Item.query.filter_by(code=code).first_or_404()
+    db.session.add(ItemTombstone(item_id=item.id, code=item.code))
+    stock_ledger.record([stock_ledger.movement_values(
+        item.id, item.code, 'delete', current_user.id, delta=-(item.quantity or 0), quantity=0,
+        from_status=item.status, from_location=item.location)])
     db.session.delete(item)
     db.session.commit()
+    facet_counts.invalidate()
+    label_cache.invalidate_item(code)
+    response_cache.invalidate(code)
     return redirect(url_for('index'))
 
+def import_upload(upload, fmt=None):
+    """Import items from an uploaded file. Returns (result, error message)"""
+    if not upload or not upload.filename:
+        return None, 'Choose a CSV, JSON or NDJSON file to import'
+    try:
+        fmt = item_import.detect_format(upload.filename, fmt)
+    except ValueError as e:
+        return None, str(e)
+
+    result = item_importer.run(item_import.iter_records(upload.stream, fmt), created_by_id=current_user.id)
+    if result['imported']:
+        facet_counts.invalidate()
+    return result, None
+
+@app.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_items():
+    if request.method == 'POST':
+        result, error = import_upload(request.files.get('file'), request.form.get('format'))
+        return render_template('import_items.html', result=result, error=error)
+
+    return render_template('import_items.html')
+
 @app.route('/qr/<code>')
 def generate_qr(code):
     item = Item.query.filter_by(code=code).first_or_404()
 
-    qr_image = generate_qr_code_image(item.code, item.name, with_label=True)
+    # Label output depends only on these inputs, their hash is the ETag
+    key = label_cache.label_key(request.host_url.rstrip('/'), item.code, item.name)
+    if request.if_none_match.contains(key):
+        response = Response(status=304)
+        response.set_etag(key)
+        return response
 
-    buffered = io.BytesIO()
-    qr_image.save(buffered, format="PNG", dpi=(300, 300))
-    buffered.seek(0)
+    data = label_cache.get_label(item.code, key)
+    if data is None:
+        qr_image = generate_qr_code_image(item.code, item.name, with_label=True)
+        data = encode_png(qr_image)
+        label_cache.store_label(item.code, key, data)
 
-    return send_file(buffered, mimetype='image/png',
+    return send_file(io.BytesIO(data), mimetype='image/png',
                      as_attachment=True,
-                     download_name=f'qr_{item.code}.png')
+                     download_name=f'qr_{item.code}.png',
+                     etag=key)
 
 def generate_small_qr_with_border(item_code, item_name):
     """Generate smaller QR code for A4 layout with border"""
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=6,  # Smaller box size
-        border=2,    # Smaller border
-    )
-
-    # Create URL for item detail page
     base_url = request.host_url.rstrip('/')
-    item_url = f"{base_url}/item/{item_code}"
+    matrix = build_qr_matrix(item_url(base_url, item_code))
+    return render_sheet_cell(matrix, item_code, item_name)
 
-    qr.add_data(item_url)
-    qr.make(fit=True)
-
-    qr_image = qr.make_image(fill_color="black", back_color="white").convert('RGB')
-
-    # Create smaller canvas (2x2.5 cm at 300 DPI = 236x295 pixels)
-    canvas_width = 236
-    canvas_height = 295
+def generate_a4_qr_sheet(items):
+    """Generate A4 sheet with multiple QR codes in grid layout"""
+    base_url = request.host_url.rstrip('/')
+    tasks = ((base_url, item.code, item.name) for item in items)
+    return render_a4_sheet(cell_from_bytes(cell) for cell in render_pool.imap_ordered(render_cell_task, tasks))
+
+def iter_qr_export_entries(rows, base_url):
+    """Yield (archive name, PNG bytes) for every label and A4 sheet.
+
+    Rows are taken 80 at a time, one sheet each. A sheet stored from an
+    earlier export with the same items in the same order is reused, and
+    labels already in the cache are not rendered again, so re-exporting
+    after a few edits only draws the items and sheets that changed.
+    """
+    stored = deque()  # (item count, sheet key, stored PNG or None) per sheet, in task order
+
+    def tasks():
+        rows_iter = iter(rows)
+        while True:
+            sheet_rows = list(islice(rows_iter, ITEMS_PER_SHEET))
+            if not sheet_rows:
+                return
+            key = label_cache.sheet_key(base_url, [(row.code, row.name) for row in sheet_rows])
+            sheet_png = label_cache.get_sheet(key)
+            stored.append((len(sheet_rows), key, sheet_png))
+            for row in sheet_rows:
+                label_png = label_cache.get_label(row.code, label_cache.label_key(base_url, row.code, row.name))
+                yield base_url, row.code, row.name, label_png, sheet_png is None
+
+    cells = []
+    sheets = deque()  # (number, key, future or None, stored PNG or None) in archive order
+    sheet_number = 0
+    remaining = 0
+
+    for code, name, label_png, label_rendered, cell in render_pool.imap_ordered(render_item_task, tasks()):
+        if not remaining:
+            remaining, key, sheet_png = stored.popleft()
+            sheet_number += 1
 
-    # Create canvas with white background
-    canvas = Image.new('RGB', (canvas_width, canvas_height), 'white')
+        # Individual QR codes (3x5 cm)
+        if label_rendered:
+            label_cache.store_label(code, label_cache.label_key(base_url, code, name), label_png)
+        yield f'individual/qr_{code}_{name[:20]}.png', label_png
+
+        # Sheets that changed are rendered on the pool as soon as their cells are ready
+        remaining -= 1
+        if sheet_png is None:
+            cells.append(cell)
+        if not remaining:
+            if sheet_png is None:
+                sheets.append((sheet_number, key, render_pool.submit(render_sheet_task, cells), None))
+                cells = []
+            else:
+                sheets.append((sheet_number, key, None, sheet_png))
+
+        while sheets and (sheets[0][2] is None or sheets[0][2].done() or len(sheets) > render_pool.RENDER_WINDOW):
+            yield finish_export_sheet(*sheets.popleft())
+
+    for sheet in sheets:
+        yield finish_export_sheet(*sheet)
+
+def finish_export_sheet(number, key, future, sheet_png):
+    """Archive entry of an export sheet, storing it when it was just rendered"""
+    if future is not None:
+        sheet_png = future.result()
+        label_cache.store_sheet(key, sheet_png)
+    return f'a4_sheets/qr_sheet_{number:02d}.png', sheet_png
+
+def qr_zip_response(rows, filename):
+    """Stream labels and A4 sheets of (code, name) rows as a ZIP download"""
+    entries = iter_qr_export_entries(rows, request.host_url.rstrip('/'))
+    return Response(stream_with_context(stream_zip(entries)),
+                    mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+def qr_pdf_response(rows, filename):
+    """A4 label sheets of (code, name) rows as a vector PDF download"""
+    # reportlab writes the document on save, spool it to disk rather than RAM
+    pdf_file = tempfile.TemporaryFile()
+    write_label_sheets(pdf_file, rows, request.host_url.rstrip('/'))
+    pdf_file.seek(0)
+
+    return send_file(pdf_file,
+                     mimetype='application/pdf',
+                     as_attachment=True,
+                     download_name=filename)
 
-    # Add border
-    draw = ImageDraw.Draw(canvas)
-    border_width = 3
-    draw.rectangle([0, 0, canvas_width-1, canvas_height-1],
-                   outline='black', width=border_width)
+@app.route('/qr/download/all')
+def download_all_qr():
+    """Stream all QR codes as a ZIP file"""
+    if not db.session.query(Item.id).first():
+        return redirect(url_for('index'))
 
-    # Smaller QR code
-    qr_size = 140  # Fixed size for grid layout
-    qr_resized = qr_image.resize((qr_size, qr_size), Image.Resampling.LANCZOS)
+    # Only code and name are needed, read in chunks instead of all at once
+    rows = db.session.query(Item.code, Item.name).order_by(Item.id).yield_per(QR_EXPORT_CHUNK_SIZE)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return qr_zip_response(rows, f'qr_codes_{timestamp}.zip')
 
-    # Center QR code horizontally
-    qr_x = (canvas_width - qr_size) // 2
-    qr_y = 15
-    canvas.paste(qr_resized, (qr_x, qr_y))
+@app.route('/qr/download/pdf')
+def download_pdf_labels():
+    """Download A4 label sheets as a vector PDF, filtered like the index page"""
+    query = apply_item_filters(db.session.query(Item.code, Item.name), request.args)
+    if not query.first():
+        return redirect(url_for('index', **request.args))
 
-    # Much bigger fonts for better readability
+    rows = query.order_by(Item.id).yield_per(QR_EXPORT_CHUNK_SIZE)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return qr_pdf_response(rows, f'qr_labels_{timestamp}.pdf')
+
+def print_mark():
+    """End of the current user's last print run, None before the first one"""
+    mark = PrintMark.query.filter_by(user_id=current_user.id).first()
+    return mark.printed_until if mark else None
+
+def print_queue_until(value=None):
+    """End of a print run from an ISO timestamp, never later than what has surely committed"""
+    # Items stamped in the last moments may still be committing, leave them for the next run
+    horizon = datetime.utcnow() - SYNC_LAG
+    if not value:
+        return horizon
     try:
-        font_code = ImageFont.truetype("/System/Library/Fonts/Arial.ttf", 28)  # Increased from 16
-        font_name = ImageFont.truetype("/System/Library/Fonts/Arial.ttf", 22)  # Increased from 12
-    except:
-        try:
-            font_code = ImageFont.truetype("Arial.ttf", 28)
-            font_name = ImageFont.truetype("Arial.ttf", 22)
-        except:
-            try:
-                font_code = ImageFont.load_default()
-                font_name = ImageFont.load_default()
-            except:
-                font_code = None
-                font_name = None
-
-    # Add item code with more spacing for bigger text
-    text_y = qr_y + qr_size + 15
-    code_text = f"Code: {item_code}"
-    if font_code:
-        bbox = draw.textbbox((0, 0), code_text, font=font_code)
-        text_width = bbox[2] - bbox[0]
-        text_x = (canvas_width - text_width) // 2
-        draw.text((text_x, text_y), code_text, fill='black', font=font_code)
-    else:
-        draw.text((10, text_y), code_text, fill='black')
-
-    # Add item name with more spacing for bigger text
-    text_y += 35  # More spacing for larger font
-    name_text = item_name
-    if len(name_text) > 15:  # Shorter for bigger text
-        name_text = name_text[:12] + "..."
-
-    if font_name:
-        bbox = draw.textbbox((0, 0), name_text, font=font_name)
-        text_width = bbox[2] - bbox[0]
-        text_x = (canvas_width - text_width) // 2
-        draw.text((text_x, text_y), name_text, fill='black', font=font_name)
-    else:
-        draw.text((10, text_y), name_text, fill='black')
-
-    return canvas
-
-def generate_a4_qr_sheet(items):
-    """Generate A4 sheet with multiple QR codes in grid layout"""
-    # A4 dimensions at 300 DPI: 2480 x 3508 pixels
-    a4_width = 2480
-    a4_height = 3508
-
-    # Create A4 canvas
-    a4_canvas = Image.new('RGB', (a4_width, a4_height), 'white')
-
-    # Grid settings
-    cols = 8  # 8 columns
-    rows = 10  # 10 rows
-    margin_x = 60
-    margin_y = 80
-
-    # Calculate spacing
-    qr_width = 236
-    qr_height = 295
-    available_width = a4_width - (2 * margin_x)
-    available_height = a4_height - (2 * margin_y)
-    spacing_x = (available_width - (cols * qr_width)) // (cols - 1) if cols > 1 else 0
-    spacing_y = (available_height - (rows * qr_height)) // (rows - 1) if rows > 1 else 0
-
-    # Place QR codes in grid
-    item_index = 0
-    for row in range(rows):
-        for col in range(cols):
-            if item_index >= len(items):
-                break
-
-            item = items[item_index]
-            qr_small = generate_small_qr_with_border(item.code, item.name)
-
-            # Calculate position
-            x = margin_x + col * (qr_width + spacing_x)
-            y = margin_y + row * (qr_height + spacing_y)
-
-            # Paste QR code
-            a4_canvas.paste(qr_small, (x, y))
-            item_index += 1
-
-        if item_index >= len(items):
-            break
-
-    return a4_canvas
-
-@app.route('/qr/download/all')
-def download_all_qr():
-    """Download all QR codes as a ZIP file"""
-    items = Item.query.all()
+        until = datetime.fromisoformat(value)
+    except ValueError:
+        abort(400)
+    if until.tzinfo is not None:
+        abort(400)
+    return min(until, horizon)
+
+def print_queue_query(columns, since, until):
+    """Items added or renamed after since, up to until"""
+    query = db.session.query(*columns).filter(Item.label_changed_at <= until)
+    if since is not None:
+        query = query.filter(Item.label_changed_at > since)
+    return query
+
+@app.route('/print-queue')
+@login_required
+def print_queue():
+    """Labels of the items added or renamed since the user's last print run"""
+    since = print_mark()
+    until = print_queue_until()
+    query = print_queue_query((Item.code, Item.name, Item.created_at, Item.label_changed_at), since, until)
+    items = query.order_by(Item.label_changed_at.desc(), Item.id.desc()).limit(PRINT_QUEUE_PREVIEW).all()
+    pending = len(items) if len(items) < PRINT_QUEUE_PREVIEW else query.count()
+
+    return render_template('print_queue.html',
+                         items=items,
+                         pending=pending,
+                         printed_until=since,
+                         until=until.isoformat())
+
+@app.route('/print-queue/labels.zip')
+@login_required
+def print_queue_zip():
+    """ZIP of the pending labels and their A4 sheets, up to ?until from the queue page"""
+    query = print_queue_query((Item.code, Item.name), print_mark(), print_queue_until(request.args.get('until')))
+    if not query.first():
+        return redirect(url_for('print_queue'))
 
-    if not items:
-        return redirect(url_for('index'))
+    rows = query.order_by(Item.id).yield_per(QR_EXPORT_CHUNK_SIZE)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return qr_zip_response(rows, f'print_queue_{timestamp}.zip')
 
-    # Create zip file in memory
-    zip_buffer = io.BytesIO()
+@app.route('/print-queue/labels.pdf')
+@login_required
+def print_queue_pdf():
+    """PDF label sheets of the pending items, up to ?until from the queue page"""
+    query = print_queue_query((Item.code, Item.name), print_mark(), print_queue_until(request.args.get('until')))
+    if not query.first():
+        return redirect(url_for('print_queue'))
 
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        # Individual QR codes (3x5 cm)
-        for item in items:
-            qr_image = generate_qr_code_image(item.code, item.name, with_label=True)
-            img_buffer = io.BytesIO()
-            qr_image.save(img_buffer, format="PNG", dpi=(300, 300))
-            img_buffer.seek(0)
-            zip_file.writestr(f'individual/qr_{item.code}_{item.name[:20]}.png', img_buffer.getvalue())
-
-        # A4 sheets with multiple QR codes
-        items_per_sheet = 80  # 8x10 grid
-        sheet_number = 1
-
-        for i in range(0, len(items), items_per_sheet):
-            sheet_items = items[i:i + items_per_sheet]
-            a4_sheet = generate_a4_qr_sheet(sheet_items)
-
-            sheet_buffer = io.BytesIO()
-            a4_sheet.save(sheet_buffer, format="PNG", dpi=(300, 300))
-            sheet_buffer.seek(0)
-
-            zip_file.writestr(f'a4_sheets/qr_sheet_{sheet_number:02d}.png', sheet_buffer.getvalue())
-            sheet_number += 1
+    rows = query.order_by(Item.id).yield_per(QR_EXPORT_CHUNK_SIZE)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return qr_pdf_response(rows, f'print_queue_{timestamp}.pdf')
 
-    zip_buffer.seek(0)
+@app.route('/print-queue/mark', methods=['POST'])
+@login_required
+def mark_printed():
+    """Move the user's watermark to the until of the printed run"""
+    until = print_queue_until(request.form.get('until'))
+    mark = PrintMark.query.filter_by(user_id=current_user.id).first()
+    since = mark.printed_until if mark else None
+    printed = print_queue_query((Item.id,), since, until).count()
+
+    if mark is None:
+        mark = PrintMark(user_id=current_user.id, printed_until=until)
+        db.session.add(mark)
+    elif until > mark.printed_until:
+        mark.printed_until = until
+    mark.marked_at = datetime.utcnow()
+    db.session.commit()
 
-    from datetime import datetime
+    flash(f"Marked {printed} label{'' if printed == 1 else 's'} as printed.", 'success')
+    return redirect(url_for('print_queue'))
+
+def run_qr_export_job(job, export_format, base_url, filters):
+    """Background QR export of the filtered items to job.path, as a ZIP or PDF"""
+    with app.app_context():
+        query = apply_item_filters(db.session.query(Item.code, Item.name), filters)
+        total = query.count()
+        if not total:
+            raise ValueError('No items match the filters')
+        job.progress(force=True, items_total=total, items_rendered=0, sheets_written=0)
+
+        rows = query.order_by(Item.id).yield_per(QR_EXPORT_CHUNK_SIZE)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+        if export_format == 'pdf':
+            def counted_rows():
+                for rendered, row in enumerate(rows, 1):
+                    yield row
+                    job.progress(items_rendered=rendered, sheets_written=(rendered - 1) // ITEMS_PER_SHEET)
+
+            with open(job.path, 'wb') as f:
+                write_label_sheets(f, counted_rows(), base_url)
+            job.set_file(f'qr_labels_{timestamp}.pdf', 'application/pdf')
+        else:
+            def counted_entries():
+                rendered = sheets = 0
+                for name, data in iter_qr_export_entries(rows, base_url):
+                    yield name, data
+                    if name.startswith('a4_sheets/'):
+                        sheets += 1
+                    else:
+                        rendered += 1
+                    job.progress(items_rendered=rendered, sheets_written=sheets)
+
+            with open(job.path, 'wb') as f:
+                for chunk in stream_zip(counted_entries()):
+                    f.write(chunk)
+            job.set_file(f'qr_codes_{timestamp}.zip', 'application/zip')
+
+        job.progress(force=True, items_rendered=total, sheets_written=-(-total // ITEMS_PER_SHEET))
+
+def job_json(state):
+    data = {key: state[key] for key in ('id', 'kind', 'status', 'progress', 'error')}
+    data['status_url'] = url_for('job_status', job_id=state['id'])
+    if state['status'] == 'finished':
+        data['download_url'] = url_for('job_download', job_id=state['id'])
+    return data
+
+@app.route('/jobs/qr-export', methods=['POST'])
+def start_qr_export():
+    """Export QR codes in the background instead of in the request.
+
+    format=zip (labels and A4 sheets) or pdf, plus the index page filters.
+    Answers 202 with the job, poll its status_url until it has a download_url.
+    """
+    export_format = request.values.get('format', 'zip')
+    if export_format not in ('zip', 'pdf'):
+        return jsonify({'error': 'format must be zip or pdf'}), 400
+
+    job_id = job_queue.submit(f'qr-{export_format}', run_qr_export_job, export_format,
+                              request.host_url.rstrip('/'), index_filters(request.values))
+    return jsonify(job_json(job_queue.get(job_id))), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    state = job_queue.get(job_id)
+    if not state:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_json(state))
+
+@app.route('/jobs/<job_id>/download')
+def job_download(job_id):
+    state = job_queue.get(job_id)
+    if not state:
+        return jsonify({'error': 'Job not found'}), 404
+    if state['status'] != 'finished':
+        return jsonify(job_json(state)), 409
+    path = job_queue.artifact_path(job_id)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Job not found'}), 404
+    return send_file(path, mimetype=state['mimetype'], as_attachment=True, download_name=state['filename'])
+
+def export_rows(args):
+    """Index-filtered items as tuples in ITEM_API_FIELDS order, read in batches"""
+    columns = [User.username if field == 'created_by' else getattr(Item, field)
+               for field in ITEM_API_FIELDS]
+    query = apply_item_filters(db.session.query(*columns), args)
+    query = query.outerjoin(User, Item.created_by_id == User.id).order_by(Item.id)
+
+    timestamp_indexes = [ITEM_API_FIELDS.index('created_at'), ITEM_API_FIELDS.index('updated_at')]
+    # yield_per streams from a server-side cursor where the driver supports one
+    for row in query.yield_per(ITEM_EXPORT_CHUNK_SIZE):
+        row = list(row)
+        for index in timestamp_indexes:
+            row[index] = format_local_timestamp(row[index])
+        yield row
+
+def export_response(stream, mimetype, extension):
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    rows = export_rows(request.args)
+    return Response(
+        stream_with_context(stream(ITEM_API_FIELDS, rows)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=items_{timestamp}.{extension}'}
+    )
 
-    return send_file(zip_buffer,
-                     mimetype='application/zip',
-                     as_attachment=True,
-                     download_name=f'qr_codes_{timestamp}.zip')
+@app.route('/export/items.csv')
+def export_items_csv():
+    """All items matching the index filters as CSV"""
+    return export_response(stream_csv, 'text/csv', 'csv')
+
+@app.route('/export/items.ndjson')
+def export_items_ndjson():
+    """All items matching the index filters, one JSON object per line"""
+    return export_response(stream_ndjson, 'application/x-ndjson', 'ndjson')
 
 # API Routes
 @app.route('/api/items')
 def api_items():
-    items = Item.query.all()
-    return jsonify([item.to_dict() for item in items])
+    """Items page by page, ordered by (updated_at, id).
+
+    Query args: cursor (from next_cursor), limit, fields=a,b,c and the
+    index page filters.
+    """
+    try:
+        position = item_api.decode_cursor(request.args.get('cursor'))
+        limit = item_api.parse_limit(request.args.get('limit'))
+        fields = item_api.parse_fields(request.args.get('fields'), ITEM_API_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Load only requested columns, id and updated_at are needed for the cursor
+    columns = {'id', 'updated_at'} | {f for f in fields if f != 'created_by'}
+    query = Item.query.options(load_only(*[getattr(Item, c) for c in columns]))
+    if 'created_by' in fields:
+        query = query.options(joinedload(Item.created_by).load_only(User.username))
+    query = apply_item_filters(query, request.args)
+
+    items, next_cursor = item_api.keyset_page(query, Item, position, limit)
+
+    return jsonify({
+        'items': [item.to_dict(fields) for item in items],
+        'next_cursor': next_cursor,
+        'limit': limit
+    })
+
+@app.route('/api/items/lookup', methods=['POST'])
+def api_items_lookup():
+    """Resolve many item codes in one request, e.g. a pallet read by a scanner.
+
+    JSON body {"codes": [...]}, optional ?fields=a,b,c as for /api/items.
+    Answers {"items": {code: item}, "missing": [codes not found]}.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        codes = item_api.parse_codes(item_api.body_value(data, 'codes'))
+        fields = item_api.parse_fields(request.args.get('fields'), ITEM_API_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # One IN query with the creators joined, instead of a lookup and a lazy load per code
+    columns = {'code'} | {f for f in fields if f != 'created_by'}
+    query = Item.query.options(load_only(*[getattr(Item, c) for c in columns]))
+    if 'created_by' in fields:
+        query = query.options(joinedload(Item.created_by).load_only(User.username))
+    items = query.filter(Item.code.in_(codes)).all() if codes else []
+
+    found = {item.code: item.to_dict(fields) for item in items}
+    return jsonify({
+        'items': found,
+        'missing': [code for code in codes if code not in found]
+    })
+
+@app.route('/api/stock/adjust', methods=['POST'])
+@login_required
+def api_stock_adjust():
+    """Apply stock deltas to many items in one transaction.
+
+    JSON body {"operations": [{"code": "A1B2C3", "delta": -2, "status": "in-use"}, ...]},
+    status optional. Quantities are changed in SQL (quantity = quantity + delta),
+    so concurrent adjustments never overwrite each other. Nothing is applied
+    if a code is unknown or a quantity would drop below zero.
+    Answers {"items": {code: {"quantity": ..., "status": ...}}}.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        adjustments = item_api.parse_stock_operations(item_api.body_value(data, 'operations'),
+                                                      item_import.ITEM_STATUSES)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not adjustments:
+        return jsonify({'items': {}})
+
+    codes = list(adjustments)
+    found = {row.code for row in db.session.query(Item.code).filter(Item.code.in_(codes))}
+    missing = [code for code in codes if code not in found]
+    if missing:
+        return jsonify({'error': 'Unknown item codes', 'missing': missing}), 404
+
+    now = datetime.utcnow()
+    quantity = func.coalesce(Item.quantity, 0)
+    movements = []
+    results = {}
+    # Rows are locked in code order, so two requests touching the same items
+    # wait on each other instead of deadlocking (Postgres)
+    for code in sorted(adjustments):
+        delta, status = adjustments[code]
+        # The ledger's "from" values come from the locked row, not the check above
+        row = (db.session.query(Item.id, Item.quantity, Item.status, Item.location)
+               .filter(Item.code == code).with_for_update().first())
+        if row is None:
+            db.session.rollback()
+            return jsonify({'error': 'Unknown item codes', 'missing': [code]}), 404
+        values = {'quantity': quantity + delta, 'updated_at': now}
+        if status:
+            values['status'] = status
+        # The guard makes the check and the change one atomic statement
+        result = db.session.execute(
+            update(Item)
+            .where(Item.code == code, quantity + delta >= 0)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            db.session.rollback()
+            return jsonify({'error': f'Stock of {code} cannot go below zero', 'code': code}), 409
+        new_quantity, new_status = (row.quantity or 0) + delta, status or row.status
+        movements.append(stock_ledger.movement_values(
+            row.id, code, 'adjust', current_user.id, delta=delta, quantity=new_quantity,
+            from_status=row.status, to_status=new_status,
+            from_location=row.location, to_location=row.location))
+        results[code] = {'quantity': new_quantity, 'status': new_status}
+
+    stock_ledger.record(movements)
+    db.session.commit()
+    if any(status for _, status in adjustments.values()):
+        facet_counts.invalidate()
+
+    return jsonify({'items': results})
+
+@app.route('/api/stock/as-of')
+def api_stock_as_of():
+    """Every item's quantity, status and location at a past moment.
+
+    Query args: at (ISO date or date-time, local time, default now) and
+    optionally location. Answered from the latest snapshot before at plus
+    the ledger since.
+    """
+    try:
+        at = parse_local_timestamp(request.args['at']) if request.args.get('at') else datetime.utcnow()
+    except ValueError:
+        return jsonify({'error': 'at must be an ISO date or date-time'}), 400
+    location = request.args.get('location') or None
+
+    items = sorted(stock_ledger.stock_as_of(at, location).values(), key=lambda item: item['code'])
+    return jsonify({
+        'at': format_local_timestamp(at),
+        'location': location,
+        'items': items,
+        'total_quantity': sum(item['quantity'] or 0 for item in items)
+    })
+
+@app.route('/api/stock/history')
+def api_stock_history():
+    """Movements into, out of or within a location, oldest first.
+
+    Query args: location (required), start and end (ISO, local time),
+    cursor (from next_cursor) and limit.
+    """
+    location = request.args.get('location')
+    if not location:
+        return jsonify({'error': 'location is required'}), 400
+    try:
+        start = parse_local_timestamp(request.args['start']) if request.args.get('start') else None
+        end = parse_local_timestamp(request.args['end']) if request.args.get('end') else None
+        position = item_api.decode_cursor(request.args.get('cursor'))
+        limit = item_api.parse_limit(request.args.get('limit'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    query = stock_ledger.location_movements(location, start, end).options(
+        joinedload(StockMovement.user).load_only(User.username))
+    movements, has_more = item_api.seek_page(query, StockMovement.created_at, StockMovement.id, position, limit)
+
+    return jsonify({
+        'movements': [movement.to_dict() for movement in movements],
+        'next_cursor': item_api.encode_cursor(movements[-1].created_at, movements[-1].id) if has_more else None,
+        'limit': limit
+    })
+
+@app.route('/api/items/changes')
+def api_item_changes():
+    """Items created, updated or deleted since a sync token.
+
+    Without ?since the client gets the whole catalogue (page by page) and
+    no deletions. Keep calling with the returned token while has_more is
+    true, then poll with the last token.
+    """
+    try:
+        limit = item_api.parse_limit(request.args.get('limit'))
+        fields = item_api.parse_fields(request.args.get('fields'), ITEM_API_FIELDS)
+        since = request.args.get('since')
+        if since:
+            item_position, tombstone_position = item_api.decode_sync_token(since)
+        else:
+            item_position, tombstone_position = None, (datetime.utcnow() - SYNC_LAG, 0)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Rows stamped in the last moments may still be committing, leave them for the next poll
+    horizon = datetime.utcnow() - SYNC_LAG
+
+    columns = {'id', 'updated_at'} | {f for f in fields if f != 'created_by'}
+    query = Item.query.options(load_only(*[getattr(Item, c) for c in columns])).filter(Item.updated_at <= horizon)
+    if 'created_by' in fields:
+        query = query.options(joinedload(Item.created_by).load_only(User.username))
+    items, more_items = item_api.seek_page(query, Item.updated_at, Item.id, item_position, limit)
+
+    tombstones, more_tombstones = item_api.seek_page(
+        ItemTombstone.query.filter(ItemTombstone.deleted_at <= horizon),
+        ItemTombstone.deleted_at, ItemTombstone.id, tombstone_position, limit)
+
+    if items:
+        item_position = (items[-1].updated_at, items[-1].id)
+    if tombstones:
+        tombstone_position = (tombstones[-1].deleted_at, tombstones[-1].id)
+
+    return jsonify({
+        'changed': [item.to_dict(fields) for item in items],
+        'deleted': [tombstone.to_dict() for tombstone in tombstones],
+        'next': item_api.encode_sync_token(item_position or (datetime.min, 0), tombstone_position),
+        'has_more': more_items or more_tombstones
+    })
+
+@app.route('/api/items/import', methods=['POST'])
+@login_required
+def api_import_items():
+    """Bulk create items from a multipart file upload, see /import"""
+    result, error = import_upload(request.files.get('file'), request.args.get('format'))
+    if error:
+        return jsonify({'error': error}), 400
+    return jsonify(result)
 
 @app.route('/api/item/<code>')
 def api_item(code):
-    item = Item.query.filter_by(code=code).first_or_404()
-    return jsonify(item.to_dict())
+    return cached_item_response('api', code, '', lambda item: jsonify(item.to_dict()).get_data(),
+                                'application/json')
+
+def add_missing_columns():
+    """Add columns introduced since the item table was created"""
+    columns = {column['name'] for column in inspect(db.engine).get_columns('item')}
+    if 'label_changed_at' not in columns:
+        column_type = Item.__table__.c.label_changed_at.type.compile(db.engine.dialect)
+        with db.engine.begin() as conn:
+            conn.execute(text(f'ALTER TABLE item ADD COLUMN label_changed_at {column_type}'))
+            # Renames were not tracked before, updated_at keeps unprinted renames in the queue
+            conn.execute(text('UPDATE item SET label_changed_at = updated_at'))
+
+def run_schema_change(change):
+    """Run one schema change, skipping it when another process made it first"""
+    try:
+        change()
+    except (IntegrityError, OperationalError, ProgrammingError) as e:
+        # Postgres reports a table created concurrently as a pg_type duplicate
+        message = str(e.orig).lower()
+        if not any(known in message for known in ('already exists', 'duplicate column', 'pg_type_typname_nsp_index')):
+            raise
+        print(f'Database upgrade: skipped, {e.orig}')
+
+def upgrade_database():
+    """Create missing tables and columns, then indexes added to existing tables since they were created.
+
+    Run once per deploy (the Procfile release command), not by every web worker.
+    """
+    for table in db.metadata.sorted_tables:
+        run_schema_change(lambda: table.create(db.engine, checkfirst=True))
+    run_schema_change(add_missing_columns)
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            run_schema_change(lambda: index.create(db.engine, checkfirst=True))
+    item_search.setup()
+    # Items from before the ledger existed only appear in history through a first snapshot
+    if not stock_ledger.has_snapshot():
+        stock_ledger.take_snapshot()
+
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Bring an existing database up to the current models."""
+    upgrade_database()
+    print('Database is up to date.')
+
+@app.cli.command('stock-snapshot')
+def stock_snapshot_command():
+    """Snapshot every item's stock, run periodically (e.g. daily from a scheduler)."""
+    taken_at = stock_ledger.take_snapshot()
+    print(f'Stock snapshot taken at {format_local_timestamp(taken_at)}.')
+
+@app.cli.command('import-items')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(item_import.IMPORT_FORMATS),
+              help='File format, taken from the extension by default.')
+@click.option('--user', 'username', help='GitHub username recorded as creator of the items.')
+def import_items_command(path, fmt, username):
+    """Bulk create items from a CSV, JSON or NDJSON file."""
+    created_by_id = None
+    if username:
+        user = User.query.filter_by(username=username).first()
+        if not user:
+            raise click.ClickException(f'Unknown user {username}')
+        created_by_id = user.id
 
-# Create tables
-with app.app_context():
-    db.create_all()
+    try:
+        fmt = item_import.detect_format(path, fmt)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    with open(path, 'rb') as f:
+        result = item_importer.run(item_import.iter_records(f, fmt), created_by_id=created_by_id)
+
+    for error in result['errors']:
+        print(f"Row {error['row']}: {error['error']}")
+    print(f"Imported {result['imported']} items, {result['failed']} rows failed.")
 
 if __name__ == '__main__':
+    # Deployed web workers leave this to "flask db-upgrade" (Procfile release)
+    with app.app_context():
+        upgrade_database()
+
     if not app.config['GITHUB_CLIENT_ID'] or not app.config['GITHUB_CLIENT_SECRET']:
         print("\n⚠️  WARNING: GitHub OAuth is not configured!")
         print("To enable GitHub authentication, you need to:")
@@ -0,0 +1,130 @@
+from datetime import datetime
+import base64
+
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Codes resolved by one batch lookup, a pallet or a shelf of labels
+MAX_LOOKUP_CODES = 5000
+
+def encode_cursor(updated_at, item_id):
+    """Opaque cursor for the position just after (updated_at, id)"""
+    raw = f'{updated_at.isoformat()}|{item_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def _decode_position(updated_at, item_id):
+    return datetime.fromisoformat(updated_at), int(item_id)
+
+def decode_cursor(cursor):
+    """Return (updated_at, id) from a cursor, None for the first page"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        updated_at, item_id = raw.split('|')
+        return _decode_position(updated_at, item_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+def encode_sync_token(item_position, tombstone_position):
+    """Opaque token holding how far a client has read items and tombstones"""
+    raw = '|'.join(f'{timestamp.isoformat()}|{row_id}'
+                   for timestamp, row_id in (item_position, tombstone_position))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_sync_token(token):
+    """Return (item position, tombstone position) from a sync token"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        item_time, item_id, tombstone_time, tombstone_id = raw.split('|')
+        return _decode_position(item_time, item_id), _decode_position(tombstone_time, tombstone_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid sync token')
+
+def parse_limit(value):
+    if value is None or value == '':
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return min(limit, MAX_PAGE_SIZE)
+
+def parse_fields(value, allowed):
+    """Fields requested with ?fields=a,b (all allowed fields by default)"""
+    if not value:
+        return list(allowed)
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+def body_value(data, key):
+    """key of a JSON request body, which must be an object"""
+    if not isinstance(data, dict):
+        raise ValueError('Request body must be a JSON object')
+    return data.get(key)
+
+def parse_codes(value, max_codes=MAX_LOOKUP_CODES):
+    """Distinct item codes from a JSON list, in request order"""
+    if not isinstance(value, list) or not all(isinstance(code, str) for code in value):
+        raise ValueError('codes must be a list of strings')
+    codes = list(dict.fromkeys(code.strip() for code in value if code.strip()))
+    if len(codes) > max_codes:
+        raise ValueError(f'At most {max_codes} codes per lookup')
+    return codes
+
+def parse_stock_operations(value, statuses, max_operations=MAX_LOOKUP_CODES):
+    """{code: (total delta, status or None)} from a list of {code, delta, status?}.
+
+    Deltas for the same code are added up, the last status given wins.
+    """
+    if not isinstance(value, list):
+        raise ValueError('operations must be a list')
+    if len(value) > max_operations:
+        raise ValueError(f'At most {max_operations} operations per request')
+
+    adjustments = {}
+    for index, operation in enumerate(value):
+        if not isinstance(operation, dict):
+            raise ValueError(f'Operation {index} must be an object')
+        code = operation.get('code')
+        delta = operation.get('delta', 0)
+        status = operation.get('status')
+        if not isinstance(code, str) or not code.strip():
+            raise ValueError(f'Operation {index}: code is required')
+        if not isinstance(delta, int) or isinstance(delta, bool):
+            raise ValueError(f'Operation {index}: delta must be an integer')
+        if status is not None and status not in statuses:
+            raise ValueError(f"Operation {index}: unknown status '{status}'")
+
+        total, last_status = adjustments.get(code.strip(), (0, None))
+        adjustments[code.strip()] = (total + delta, status or last_status)
+    return adjustments
+
+def seek_page(query, time_column, id_column, position, limit):
+    """Rows of query ordered by (time_column, id_column), after position.
+
+    Seeks past the last seen row instead of using OFFSET, so every page
+    costs the same however deep the client is. Returns (rows, has_more).
+    """
+    if position:
+        timestamp, row_id = position
+        query = query.filter(or_(
+            time_column > timestamp,
+            and_(time_column == timestamp, id_column > row_id)
+        ))
+
+    rows = query.order_by(time_column, id_column).limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
+
+def keyset_page(query, model, position, limit):
+    """One page of query ordered by (updated_at, id). Returns (rows, next cursor)"""
+    rows, has_more = seek_page(query, model.updated_at, model.id, position, limit)
+    if not has_more:
+        return rows, None
+    return rows, encode_cursor(rows[-1].updated_at, rows[-1].id)
@@ -0,0 +1,43 @@
+import csv
+import io
+import json
+
+EXPORT_BATCH_ROWS = 500
+
+def stream_csv(fields, rows, batch_rows=EXPORT_BATCH_ROWS):
+    """Yield a CSV document as UTF-8 chunks of batch_rows rows.
+
+    rows are value sequences in the order of fields. Starts with a byte
+    order mark so spreadsheet apps detect UTF-8 (Thai names).
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    pending = 0
+    yield '\ufeff'.encode('utf-8')
+
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= batch_rows:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    yield buffer.getvalue().encode('utf-8')
+
+def stream_ndjson(fields, rows, batch_rows=EXPORT_BATCH_ROWS):
+    """Yield one JSON object per line, batch_rows lines per chunk"""
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    lines = []
+    for row in rows:
+        lines.append(encode(dict(zip(fields, row))))
+        if len(lines) >= batch_rows:
+            lines.append('')
+            yield '\n'.join(lines).encode('utf-8')
+            lines = []
+
+    if lines:
+        lines.append('')
+        yield '\n'.join(lines).encode('utf-8')
@@ -0,0 +1,271 @@
+import io
+import csv
+import json
+import os
+import random
+import re
+import string
+
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+IMPORT_FORMATS = ('csv', 'json', 'ndjson')
+IMPORT_FIELDS = ('code', 'name', 'description', 'category', 'location', 'quantity', 'status')
+# Same choices as the add item form
+ITEM_STATUSES = ('available', 'in-use', 'maintenance', 'retired', 'pending', 'damaged',
+                 'reserved', 'lost', 'ordered', 'trash', 'ran-out')
+CODE_CHARS = string.ascii_uppercase + string.digits
+CODE_LENGTH = 6
+CODE_PATTERN = re.compile(r'^[A-Z0-9]+$')
+
+def detect_format(filename, fmt=None):
+    """Import format from an explicit choice or the file extension"""
+    fmt = (fmt or os.path.splitext(filename or '')[1].lstrip('.')).lower()
+    if fmt == 'jsonl':
+        fmt = 'ndjson'
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError('File must be .csv, .json or .ndjson')
+    return fmt
+
+def iter_records(fileobj, fmt):
+    """Yield (row number, record) from a binary file without loading it whole.
+
+    Rows are numbered like a spreadsheet for CSV (header is row 1) and from
+    1 for JSON and NDJSON. Raises ValueError when the file cannot be read
+    any further.
+    """
+    stream = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'csv':
+            reader = csv.DictReader(stream)
+            for record in reader:
+                yield reader.line_num, record
+        elif fmt == 'ndjson':
+            for line_number, line in enumerate(stream, 1):
+                if line.strip():
+                    try:
+                        yield line_number, json.loads(line)
+                    except json.JSONDecodeError as e:
+                        # One bad line only fails its own row
+                        yield line_number, ValueError(f'Invalid JSON: {e.msg}')
+        else:
+            yield from _iter_json_array(stream)
+    except UnicodeDecodeError:
+        raise ValueError('File is not UTF-8 text')
+    except csv.Error as e:
+        raise ValueError(f'Invalid CSV: {e}')
+    finally:
+        # The upload owns the binary file
+        stream.detach()
+
+_WHITESPACE = re.compile(r'\s*')
+
+def _iter_json_array(stream, read_size=64 * 1024):
+    # Decode one element at a time, reading more text only when an element is cut off
+    decoder = json.JSONDecoder()
+    buffer = stream.read(read_size)
+    pos = _WHITESPACE.match(buffer).end()
+    if buffer[pos:pos + 1] != '[':
+        raise ValueError('JSON file must contain an array of items')
+    pos += 1
+    row_number = 0
+    eof = False
+    expect_value = True
+
+    while True:
+        pos = _WHITESPACE.match(buffer, pos).end()
+        if pos == len(buffer):
+            if eof:
+                raise ValueError('Unexpected end of JSON file')
+            buffer = buffer[pos:] + stream.read(read_size)
+            pos = 0
+            eof = len(buffer) == 0
+            continue
+
+        char = buffer[pos]
+        if char == ']' and (row_number == 0 or not expect_value):
+            return
+        if not expect_value:
+            if char != ',':
+                raise ValueError(f'Expected "," after item {row_number}')
+            pos += 1
+            expect_value = True
+            continue
+
+        try:
+            record, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            chunk = '' if eof else stream.read(read_size)
+            if not chunk:
+                raise ValueError(f'Invalid JSON in item {row_number + 1}: {e.msg}')
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+
+        row_number += 1
+        yield row_number, record
+        pos = end
+        expect_value = False
+
+def _column_lengths(model):
+    return {column.name: column.type.length for column in model.__table__.columns
+            if getattr(column.type, 'length', None)}
+
+def clean_record(record, lengths):
+    """Validated item column values from one import record. Raises ValueError"""
+    if isinstance(record, Exception):
+        raise record
+    if not isinstance(record, dict):
+        raise ValueError('Row must be an object with item fields')
+
+    values = {}
+    for field in IMPORT_FIELDS:
+        value = record.get(field)
+        if value is not None and not isinstance(value, str):
+            value = str(value) if field != 'quantity' else value
+        if isinstance(value, str):
+            value = value.strip() or None
+        values[field] = value
+
+    if not values['name']:
+        raise ValueError('name is required')
+
+    if values['code']:
+        values['code'] = values['code'].upper()
+        if not CODE_PATTERN.match(values['code']):
+            raise ValueError('code may only contain letters and numbers')
+
+    quantity = values['quantity']
+    if quantity is None:
+        quantity = 1
+    elif isinstance(quantity, bool) or (isinstance(quantity, float) and not quantity.is_integer()):
+        # int() would silently cut 2.7 to 2, CSV rejects "2.5" already
+        raise ValueError('quantity must be a whole number')
+    else:
+        try:
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            raise ValueError('quantity must be a whole number')
+    if quantity < 0:
+        raise ValueError('quantity cannot be negative')
+    values['quantity'] = quantity
+
+    values['status'] = (values['status'] or 'available').lower()
+    if values['status'] not in ITEM_STATUSES:
+        raise ValueError(f"Unknown status '{values['status']}'")
+
+    for field, length in lengths.items():
+        if isinstance(values.get(field), str) and len(values[field]) > length:
+            raise ValueError(f'{field} is longer than {length} characters')
+    return values
+
+def new_import_result():
+    return {'imported': 0, 'failed': 0, 'errors': []}
+
+def add_error(result, row_number, error):
+    result['failed'] += 1
+    # Keep the report bounded for files that are wrong on every row
+    if len(result['errors']) < MAX_REPORTED_ERRORS:
+        result['errors'].append({'row': row_number, 'error': str(error)})
+
+class ItemImporter:
+    """Bulk item creation from parsed import records.
+
+    Rows are validated one by one, then inserted in chunks of chunk_size
+    with a single executemany and one commit per chunk. Codes are checked
+    and allocated per chunk with one IN query instead of a lookup per row.
+    A chunk that fails to insert is reported and the import goes on.
+    after_insert, if given, is called with the inserted mappings of every
+    chunk before it is committed.
+    """
+
+    def __init__(self, db, model, chunk_size=IMPORT_CHUNK_SIZE, after_insert=None):
+        self.db = db
+        self.model = model
+        self.chunk_size = chunk_size
+        self.after_insert = after_insert
+        self._lengths = None
+
+    def run(self, records, created_by_id=None):
+        """Import (row number, record) pairs. Returns imported/failed counts and row errors"""
+        if self._lengths is None:
+            self._lengths = _column_lengths(self.model)
+        result = new_import_result()
+        used_codes = set()
+        chunk = []
+        row_number = 0
+
+        try:
+            for row_number, record in records:
+                try:
+                    values = clean_record(record, self._lengths)
+                except ValueError as e:
+                    add_error(result, row_number, e)
+                    continue
+
+                if values['code']:
+                    if values['code'] in used_codes:
+                        add_error(result, row_number, f"Code {values['code']} is used by another row of this import")
+                        continue
+                    used_codes.add(values['code'])
+
+                chunk.append((row_number, values))
+                if len(chunk) >= self.chunk_size:
+                    self._insert_chunk(chunk, used_codes, result, created_by_id)
+                    chunk = []
+        except ValueError as e:
+            # The file cannot be read past this point, keep what was valid so far
+            add_error(result, row_number + 1, e)
+
+        if chunk:
+            self._insert_chunk(chunk, used_codes, result, created_by_id)
+        return result
+
+    def existing_codes(self, codes):
+        if not codes:
+            return set()
+        rows = self.db.session.query(self.model.code).filter(self.model.code.in_(list(codes))).all()
+        return {row.code for row in rows}
+
+    def allocate_codes(self, count, used_codes):
+        """count new random codes that are neither in the database nor in used_codes"""
+        codes = []
+        while len(codes) < count:
+            needed = count - len(codes)
+            # A few spare candidates so one round is nearly always enough
+            candidates = {''.join(random.choices(CODE_CHARS, k=CODE_LENGTH))
+                          for _ in range(needed + needed // 10 + 8)}
+            candidates -= used_codes
+            fresh = list(candidates - self.existing_codes(candidates))[:needed]
+            used_codes.update(fresh)
+            codes.extend(fresh)
+        return codes
+
+    def _insert_chunk(self, chunk, used_codes, result, created_by_id):
+        taken = self.existing_codes([values['code'] for _, values in chunk if values['code']])
+        rows = []
+        for row_number, values in chunk:
+            if values['code'] in taken:
+                add_error(result, row_number, f"Item code {values['code']} already exists")
+            else:
+                rows.append((row_number, values))
+
+        without_code = [values for _, values in rows if not values['code']]
+        for values, code in zip(without_code, self.allocate_codes(len(without_code), used_codes)):
+            values['code'] = code
+
+        mappings = [dict(values, created_by_id=created_by_id) for _, values in rows]
+        if not mappings:
+            return
+        try:
+            # render_nulls keeps every row in one executemany batch
+            self.db.session.bulk_insert_mappings(self.model, mappings, render_nulls=True)
+            if self.after_insert:
+                self.after_insert(mappings)
+            self.db.session.commit()
+        except Exception as e:
+            self.db.session.rollback()
+            print(f'Import error: {e}')
+            for row_number, _ in rows:
+                add_error(result, row_number, 'Could not be saved, try importing it again')
+            return
+        result['imported'] += len(mappings)
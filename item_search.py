@@ -0,0 +1,140 @@
+import os
+import re
+import time
+
+from sqlalchemy import column, func, literal_column, or_, table, text
+
+# Seconds before a process looks for a missing search index again
+SEARCH_INDEX_RECHECK = float(os.environ.get('SEARCH_INDEX_RECHECK', 60))
+
+class ItemSearch:
+    """Full-text search over item name, code and description.
+
+    SQLite uses an external-content FTS5 table kept in sync by triggers,
+    Postgres a GIN index on a tsvector expression. Both match every word
+    of the search as a prefix and rank results. Any other database, or a
+    search with no words in it, falls back to LIKE.
+
+    Whether the index is used is read from the database schema, so every
+    process answers a search the same way.
+    """
+
+    def __init__(self, db, model):
+        self.db = db
+        self.model = model
+        self.table_name = model.__tablename__
+        self.fts_name = f'{self.table_name}_fts'
+        self.index_name = f'ix_{self.table_name}_search'
+        self._backend = None
+        self._checked_at = None
+
+    @property
+    def vector_sql(self):
+        # Must match the indexed expression exactly for Postgres to use the index
+        return (f"to_tsvector('simple', coalesce({self.table_name}.name, '') || ' ' || "
+                f"coalesce({self.table_name}.code, '') || ' ' || "
+                f"coalesce({self.table_name}.description, ''))")
+
+    def setup(self):
+        """Create the search index if missing (idempotent, run by the database upgrade)"""
+        dialect = self.db.engine.dialect.name
+        try:
+            if dialect == 'sqlite':
+                self._setup_sqlite()
+            elif dialect == 'postgresql':
+                self._setup_postgres()
+        except Exception as e:
+            self.db.session.rollback()
+            print(f'Search index error: {e}')
+        self._checked_at = None
+
+    @property
+    def backend(self):
+        """'sqlite' or 'postgresql' when the database has the search index, else None for LIKE"""
+        now = time.monotonic()
+        if self._backend is None and (self._checked_at is None
+                                      or now - self._checked_at >= SEARCH_INDEX_RECHECK):
+            first_check = self._checked_at is None
+            self._checked_at = now
+            self._backend = self._index_backend(warn=first_check)
+        return self._backend
+
+    def _index_backend(self, warn=False):
+        dialect = self.db.engine.dialect.name
+        if dialect == 'sqlite':
+            name = self.fts_name
+            sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+        elif dialect == 'postgresql':
+            name = self.index_name
+            sql = "SELECT 1 FROM pg_indexes WHERE indexname = :name"
+        else:
+            return None
+        if self.db.session.execute(text(sql), {'name': name}).first():
+            return dialect
+        if warn:
+            print(f'Warning: search index {name} is missing, searching with LIKE until the database upgrade creates it')
+        return None
+
+    def _setup_sqlite(self):
+        t, fts = self.table_name, self.fts_name
+        exists = self.db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': fts}
+        ).first()
+
+        statements = [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+            f"name, code, description, content='{t}', content_rowid='id')",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {t} BEGIN "
+            f"INSERT INTO {fts}(rowid, name, code, description) "
+            f"VALUES (new.id, new.name, new.code, new.description); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {t} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, name, code, description) "
+            f"VALUES ('delete', old.id, old.name, old.code, old.description); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF name, code, description ON {t} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, name, code, description) "
+            f"VALUES ('delete', old.id, old.name, old.code, old.description); "
+            f"INSERT INTO {fts}(rowid, name, code, description) "
+            f"VALUES (new.id, new.name, new.code, new.description); END",
+        ]
+        if not exists:
+            # Index rows that were there before search was set up
+            statements.append(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+        for statement in statements:
+            self.db.session.execute(text(statement))
+        self.db.session.commit()
+
+    def _setup_postgres(self):
+        self.db.session.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {self.index_name} "
+            f"ON {self.table_name} USING GIN ({self.vector_sql})"
+        ))
+        self.db.session.commit()
+
+    def apply(self, query, search, ranked=False):
+        """Filter query to items matching search, best matches first if ranked"""
+        words = re.findall(r'\w+', search)
+        if not words or self.backend is None:
+            return self._apply_like(query, search)
+
+        if self.backend == 'sqlite':
+            fts = table(self.fts_name, column('rowid'), column('rank'))
+            match = ' '.join(f'"{word}"*' for word in words)
+            query = query.join(fts, fts.c.rowid == self.model.id).filter(
+                literal_column(self.fts_name).op('MATCH')(match))
+            # FTS5 rank is bm25, lower is better
+            return query.order_by(fts.c.rank) if ranked else query
+
+        ts_query = func.to_tsquery('simple', ' & '.join(f'{word}:*' for word in words))
+        vector = literal_column(self.vector_sql)
+        query = query.filter(vector.op('@@')(ts_query))
+        return query.order_by(func.ts_rank(vector, ts_query).desc()) if ranked else query
+
+    def _apply_like(self, query, search):
+        return query.filter(
+            or_(
+                self.model.name.contains(search),
+                self.model.code.contains(search),
+                self.model.description.contains(search)
+            )
+        )
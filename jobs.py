@@ -0,0 +1,162 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+# Job state and finished files live here, shared by every worker process on the machine
+JOB_DIR = os.environ.get('EXPORT_JOB_DIR', os.path.join(tempfile.gettempdir(), 'export_jobs'))
+# Exports run at the same time per worker process, the rest wait their turn
+JOB_WORKERS = int(os.environ.get('EXPORT_JOB_WORKERS', 1))
+# Finished jobs and their files are removed after this many seconds
+JOB_RETENTION = int(os.environ.get('EXPORT_JOB_RETENTION', 3600))
+# Progress is written to disk at most this often
+PROGRESS_INTERVAL = 0.5
+
+_JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+class Job:
+    """Handle passed to a running job to report progress and name its file"""
+
+    def __init__(self, queue, state):
+        self._queue = queue
+        self._state = state
+        self._last_write = 0
+        self.id = state['id']
+        self.path = queue.artifact_path(self.id)
+
+    def progress(self, force=False, **counts):
+        """Update progress counters, e.g. progress(items_rendered=10)"""
+        self._state['progress'].update(counts)
+        now = time.monotonic()
+        if force or now - self._last_write >= PROGRESS_INTERVAL:
+            self._last_write = now
+            self._queue._save(self._state)
+
+    def set_file(self, filename, mimetype):
+        """Name and type the finished file at job.path is downloaded as"""
+        self._state['filename'] = filename
+        self._state['mimetype'] = mimetype
+
+class JobQueue:
+    """Background jobs on a thread pool with their state in JSON files.
+
+    A job is func(job, *args) writing its output to job.path. State files
+    are replaced atomically, so any worker process can report a job's
+    progress while another one runs it. A job whose process died while it
+    was queued or running is reported as failed.
+    """
+
+    def __init__(self, directory=JOB_DIR, workers=JOB_WORKERS, retention=JOB_RETENTION):
+        self.directory = directory
+        self.workers = workers
+        self.retention = retention
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='export-job')
+            return self._executor
+
+    def _state_path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def artifact_path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.out')
+
+    def _save(self, state):
+        state['updated_at'] = time.time()
+        path = self._state_path(state['id'])
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f'Job state error: {e}')
+
+    def submit(self, kind, func, *args):
+        """Queue func(job, *args) and return the new job id"""
+        os.makedirs(self.directory, exist_ok=True)
+        self.cleanup()
+
+        state = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'status': 'queued',
+            'progress': {},
+            'error': None,
+            'filename': None,
+            'mimetype': None,
+            'pid': os.getpid(),
+            'created_at': time.time(),
+            'finished_at': None,
+        }
+        self._save(state)
+        self._get_executor().submit(self._run, state, func, args)
+        return state['id']
+
+    def _run(self, state, func, args):
+        job = Job(self, state)
+        state['status'] = 'running'
+        self._save(state)
+        try:
+            func(job, *args)
+            state['status'] = 'finished'
+        except Exception as e:
+            print(f'Job {state["id"]} error: {e}')
+            state['status'] = 'failed'
+            state['error'] = str(e)
+            try:
+                os.remove(job.path)
+            except OSError:
+                pass
+        state['finished_at'] = time.time()
+        self._save(state)
+
+    def get(self, job_id):
+        """State of a job as a dict, None if it is unknown or expired"""
+        if not _JOB_ID.match(job_id or ''):
+            return None
+        try:
+            with open(self._state_path(job_id)) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if state['status'] in ('queued', 'running') and not _process_alive(state['pid']):
+            state['status'] = 'failed'
+            state['error'] = 'The export was interrupted, please start it again'
+        return state
+
+    def cleanup(self):
+        """Remove job files older than the retention period"""
+        cutoff = time.time() - self.retention
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists but belongs to someone else
+        return True
+    return True
+
+job_queue = JobQueue()
@@ -0,0 +1,87 @@
+from PIL import Image, ImageFont
+import os
+import threading
+
+LOGO_FILE_NAME = '02.jpg'
+# Tried in order, the first font file that loads is used for every size
+FONT_PATHS = ["Arial.ttf", "/System/Library/Fonts/Arial.ttf"]
+
+_lock = threading.Lock()
+_logo = None
+_logo_loaded = False
+_logo_version = ''
+_logos = {}
+_fonts = {}
+
+def _load_logo():
+    global _logo, _logo_loaded, _logo_version
+    try:
+        logo_path = os.path.join(os.getcwd(), LOGO_FILE_NAME)
+        if os.path.exists(logo_path):
+            stat = os.stat(logo_path)
+            with Image.open(logo_path) as logo:
+                logo.load()
+                _logo = logo
+            _logo_version = f'{stat.st_size}:{stat.st_mtime_ns}'
+    except Exception as e:
+        print(f'Logo error: {e}')
+    _logo_loaded = True
+
+def get_logo(size):
+    """Logo resized to size (width, height), or None if there is no logo.
+
+    Decoded once per process and resized once per size. The image is
+    shared: paste it, never draw on it.
+    """
+    logo = _logos.get(size)
+    if logo is not None or (_logo_loaded and _logo is None):
+        return logo
+
+    with _lock:
+        if not _logo_loaded:
+            _load_logo()
+        if _logo is None:
+            return None
+        if size not in _logos:
+            _logos[size] = _logo.resize(size)
+        return _logos[size]
+
+def logo_version():
+    """Identifies the loaded logo file, part of the label cache key"""
+    if not _logo_loaded:
+        with _lock:
+            if not _logo_loaded:
+                _load_logo()
+    return _logo_version
+
+def _load_font(size):
+    for path in FONT_PATHS:
+        try:
+            return ImageFont.truetype(path, size)
+        except Exception:
+            continue
+    try:
+        return ImageFont.load_default()
+    except Exception:
+        return None
+
+def get_font(size):
+    """Label font at size points, resolved once per process (None if unavailable)"""
+    if size not in _fonts:
+        with _lock:
+            if size not in _fonts:
+                _fonts[size] = _load_font(size)
+    return _fonts[size]
+
+def reload_assets():
+    """Forget the decoded logo and fonts of this process, e.g. after 02.jpg was replaced.
+
+    Render pool workers have their own copies, use render_pool.reload_assets.
+    """
+    global _logo, _logo_loaded, _logo_version
+    with _lock:
+        _logo = None
+        _logo_loaded = False
+        _logo_version = ''
+        _logos.clear()
+        _fonts.clear()
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+from label_render import LABEL_LAYOUT_VERSION
+import label_assets
+
+LABEL_CACHE_DIR = os.environ.get('QR_LABEL_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'qr_label_cache'))
+LABEL_CACHE_MAX_BYTES = int(os.environ.get('QR_LABEL_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# Rendered A4 sheet PNGs of the ZIP export, kept apart so they never push labels out
+SHEET_CACHE_DIR = os.environ.get('QR_SHEET_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'qr_sheet_cache'))
+SHEET_CACHE_MAX_BYTES = int(os.environ.get('QR_SHEET_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+SHEET_GROUP = 'a4_sheets'
+
+class DiskLRUCache:
+    """Size-bounded byte cache on the local filesystem.
+
+    Entries are stored as <directory>/<group>/<key> so that every entry of
+    one group (an item code) can be dropped at once. File mtime is the
+    recency used for eviction and is bumped on every hit.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None  # Bytes on disk, rescanned when unknown
+
+    def _group_dir(self, group):
+        # Codes are user input, never use them as path components directly
+        return os.path.join(self.directory, hashlib.sha1(group.encode('utf-8')).hexdigest()[:16])
+
+    def get(self, group, key):
+        path = os.path.join(self._group_dir(group), key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def set(self, group, key, data):
+        directory = self._group_dir(group)
+        path = os.path.join(directory, key)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # Write then rename so concurrent readers never see partial files
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f'Label cache error: {e}')
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan()[1]
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def invalidate(self, group):
+        shutil.rmtree(self._group_dir(group), ignore_errors=True)
+        with self._lock:
+            self._size = None
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        with self._lock:
+            self._size = 0
+
+    def _scan(self):
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        return entries, total
+
+    def _evict(self):
+        # Drop least recently used entries down to 90% of the budget
+        entries, total = self._scan()
+        target = self.max_bytes * 0.9
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._size = total
+
+label_cache = DiskLRUCache(LABEL_CACHE_DIR, LABEL_CACHE_MAX_BYTES)
+sheet_cache = DiskLRUCache(SHEET_CACHE_DIR, SHEET_CACHE_MAX_BYTES)
+
+def label_key(base_url, item_code, item_name):
+    """Content address of a rendered 3x5 cm label, also used as its ETag"""
+    source = '\0'.join([str(LABEL_LAYOUT_VERSION), label_assets.logo_version(),
+                         base_url, item_code, item_name])
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+def get_label(item_code, key):
+    return label_cache.get(item_code, key)
+
+def store_label(item_code, key, data):
+    label_cache.set(item_code, key, data)
+
+def invalidate_item(item_code):
+    """Forget every cached label of an item (renamed or deleted)"""
+    label_cache.invalidate(item_code)
+
+def sheet_key(base_url, items):
+    """Content address of an A4 sheet PNG from its ordered (code, name) items.
+
+    Any edit to an item on the sheet, or a change in their order, gives a
+    new key, so stored sheets never need invalidating and old ones age out.
+    """
+    source = '\0'.join([str(LABEL_LAYOUT_VERSION), label_assets.logo_version(), base_url]
+                       + [f'{code}\x1f{name}' for code, name in items])
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+def get_sheet(key):
+    return sheet_cache.get(SHEET_GROUP, key)
+
+def store_sheet(key, data):
+    sheet_cache.set(SHEET_GROUP, key, data)
@@ -0,0 +1,91 @@
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+import label_render
+from instrumentation import stage, timed
+
+# Same grid as the raster A4 sheet, converted from 300 DPI pixels to points
+PX = 72 / 300
+CELL_FONT = "Helvetica"
+
+def draw_qr(c, matrix, x, top, size, border):
+    """Draw a QR module matrix as filled rectangles.
+
+    (x, top) is the top-left corner of the quiet zone in PDF points.
+    Horizontal runs of dark modules are merged into a single rectangle.
+    """
+    module = size / (len(matrix) + 2 * border)
+    path = c.beginPath()
+    for row_index, row in enumerate(matrix):
+        y = top - (border + row_index + 1) * module
+        run_start = None
+        for col, dark in enumerate(row):
+            if dark and run_start is None:
+                run_start = col
+            elif not dark and run_start is not None:
+                path.rect(x + (border + run_start) * module, y, (col - run_start) * module, module)
+                run_start = None
+        if run_start is not None:
+            path.rect(x + (border + run_start) * module, y, (len(row) - run_start) * module, module)
+    c.drawPath(path, stroke=0, fill=1)
+
+def _draw_centered_string(c, text, center_x, top, font_px):
+    # Pillow places text by its top edge, PDF by its baseline
+    font_size = font_px * PX
+    baseline = top - font_size * 0.8
+    text_width = c.stringWidth(text, CELL_FONT, font_size)
+    c.setFont(CELL_FONT, font_size)
+    c.drawString(center_x - text_width / 2, baseline, text)
+
+@timed('pdf_draw')
+def draw_sheet_cell(c, matrix, item_code, item_name, x, top):
+    """Vector version of label_render.render_sheet_cell at (x, top) in points"""
+    width = label_render.CELL_WIDTH * PX
+    height = label_render.CELL_HEIGHT * PX
+
+    c.setLineWidth(3 * PX)
+    c.rect(x, top - height, width, height, stroke=1, fill=0)
+
+    qr_size = label_render.CELL_QR_SIZE * PX
+    qr_top = top - 15 * PX
+    draw_qr(c, matrix, x + (width - qr_size) / 2, qr_top, qr_size, label_render.CELL_QR_BORDER)
+
+    text_top = qr_top - qr_size - 15 * PX
+    _draw_centered_string(c, f"Code: {item_code}", x + width / 2, text_top, 28)
+
+    text_top -= 35 * PX
+    name_text = item_name
+    if len(name_text) > 15:
+        name_text = name_text[:12] + "..."
+    _draw_centered_string(c, name_text, x + width / 2, text_top, 22)
+
+def cell_position(index):
+    """Top-left corner in points of grid cell index on a page"""
+    x, y = label_render.sheet_cell_origin(index)
+    return x * PX, A4[1] - y * PX
+
+def write_label_sheets(fileobj, rows, base_url):
+    """Write A4 label sheets for (code, name) rows as a vector PDF.
+
+    Rows are consumed as an iterator and every page is finished with
+    showPage as soon as its 80 cells are drawn. Returns the label count.
+    """
+    c = canvas.Canvas(fileobj, pagesize=A4, pageCompression=1)
+    c.setTitle('QR Labels')
+
+    count = 0
+    for row in rows:
+        index = count % label_render.ITEMS_PER_SHEET
+        if count and index == 0:
+            with stage('pdf_write'):
+                c.showPage()
+
+        matrix = label_render.build_qr_matrix(label_render.item_url(base_url, row.code))
+        x, top = cell_position(index)
+        draw_sheet_cell(c, matrix, row.code, row.name, x, top)
+        count += 1
+
+    with stage('pdf_write'):
+        c.showPage()
+        c.save()
+    return count
@@ -0,0 +1,202 @@
+import qrcode
+from PIL import Image, ImageDraw
+import io
+
+import label_assets
+from instrumentation import timed
+
+# Bump whenever the rendered labels change so cached PNGs are not reused
+LABEL_LAYOUT_VERSION = 1
+
+# Individual label: 3x5 cm at 300 DPI
+LABEL_WIDTH = 354
+LABEL_HEIGHT = 590
+LABEL_QR_SIZE = 240
+LABEL_QR_BORDER = 4
+
+# A4 sheet cell: 2x2.5 cm at 300 DPI
+CELL_WIDTH = 236
+CELL_HEIGHT = 295
+CELL_QR_SIZE = 140
+CELL_QR_BORDER = 2
+
+# A4 dimensions at 300 DPI with an 8x10 grid
+A4_WIDTH = 2480
+A4_HEIGHT = 3508
+SHEET_COLS = 8
+SHEET_ROWS = 10
+SHEET_MARGIN_X = 60
+SHEET_MARGIN_Y = 80
+ITEMS_PER_SHEET = SHEET_COLS * SHEET_ROWS
+
+# Plain QR codes keep the original box_size=10 rendering with a 60px logo
+QR_BOX_SIZE = 10
+QR_LOGO_SIZE = 60
+
+def item_url(base_url, item_code):
+    """URL of the item detail page encoded in every label"""
+    return f"{base_url}/item/{item_code}"
+
+@timed('qr_encode')
+def build_qr_matrix(data):
+    """Encode data once and return its module matrix without quiet zone"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        border=0,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+# Module values (False/True) to pixel values, dark modules are black
+_MODULE_PIXELS = bytes.maketrans(b'\x00\x01', b'\xff\x00')
+
+def rasterize_qr(matrix, border, size):
+    """Draw a module matrix straight at size x size pixels as an L image.
+
+    Each row of modules becomes pixel bytes in one translate call and the
+    one-pixel-per-module image is scaled with NEAREST, so every module
+    stays crisp instead of being drawn at box_size 10 and LANCZOS-downscaled.
+    """
+    modules = len(matrix) + 2 * border
+    quiet = b'\xff' * border
+    quiet_rows = b'\xff' * (modules * border)
+    pixels = b''.join(quiet + bytes(row).translate(_MODULE_PIXELS) + quiet for row in matrix)
+
+    image = Image.frombytes('L', (modules, modules), quiet_rows + pixels + quiet_rows)
+    return image.resize((size, size), Image.Resampling.NEAREST)
+
+def paste_logo(image, logo_size, qr_box=None):
+    """Paste the logo in the middle of a QR code if there is one.
+
+    qr_box is the (x, y, size) of the QR code on image, the whole image by
+    default. image must be RGB to keep the logo's colours.
+    """
+    logo = label_assets.get_logo((logo_size, logo_size))
+    if logo is None:
+        return
+
+    qr_x, qr_y, qr_size = qr_box or (0, 0, image.size[0])
+    logo_x = qr_x + (qr_size - logo.size[0]) // 2
+    logo_y = qr_y + (qr_size - logo.size[1]) // 2
+    image.paste(logo, (logo_x, logo_y))
+
+def _draw_centered_text(draw, text, y, font, canvas_width, fallback_x):
+    if font:
+        bbox = draw.textbbox((0, 0), text, font=font)
+        text_width = bbox[2] - bbox[0]
+        text_x = (canvas_width - text_width) // 2
+        draw.text((text_x, y), text, fill='black', font=font)
+    else:
+        draw.text((fallback_x, y), text, fill='black')
+
+@timed('draw')
+def render_plain_qr(matrix):
+    """Plain QR code with logo at the original box_size 10 resolution"""
+    modules = len(matrix) + 2 * LABEL_QR_BORDER
+    qr_image = rasterize_qr(matrix, LABEL_QR_BORDER, modules * QR_BOX_SIZE).convert('RGB')
+    paste_logo(qr_image, QR_LOGO_SIZE)
+    return qr_image
+
+@timed('draw')
+def render_label(matrix, item_code, item_name):
+    """3x5 cm label with QR code, logo, item code and item name"""
+    canvas = Image.new('RGB', (LABEL_WIDTH, LABEL_HEIGHT), 'white')
+
+    # Center QR code horizontally and place it in upper portion.
+    # The L image is pasted straight onto the RGB canvas, then the logo on top
+    qr_x = (LABEL_WIDTH - LABEL_QR_SIZE) // 2
+    qr_y = 30
+    canvas.paste(rasterize_qr(matrix, LABEL_QR_BORDER, LABEL_QR_SIZE), (qr_x, qr_y))
+
+    # Logo keeps the same share of the QR code as on the box_size 10 image
+    modules = len(matrix) + 2 * LABEL_QR_BORDER
+    paste_logo(canvas, round(QR_LOGO_SIZE * LABEL_QR_SIZE / (modules * QR_BOX_SIZE)),
+               (qr_x, qr_y, LABEL_QR_SIZE))
+
+    draw = ImageDraw.Draw(canvas)
+    font_large = label_assets.get_font(32)
+    font_small = label_assets.get_font(24)
+
+    text_y = qr_y + LABEL_QR_SIZE + 40
+    _draw_centered_text(draw, f"Code: {item_code}", text_y, font_large, LABEL_WIDTH, 20)
+
+    # Item name, truncated for the larger text
+    text_y += 50
+    name_text = item_name
+    if len(name_text) > 25:
+        name_text = name_text[:22] + "..."
+    _draw_centered_text(draw, name_text, text_y, font_small, LABEL_WIDTH, 20)
+
+    return canvas
+
+@timed('draw')
+def render_sheet_cell(matrix, item_code, item_name):
+    """2x2.5 cm bordered cell for the A4 sheet"""
+    canvas = Image.new('RGB', (CELL_WIDTH, CELL_HEIGHT), 'white')
+
+    draw = ImageDraw.Draw(canvas)
+    border_width = 3
+    draw.rectangle([0, 0, CELL_WIDTH - 1, CELL_HEIGHT - 1],
+                   outline='black', width=border_width)
+
+    qr_image = rasterize_qr(matrix, CELL_QR_BORDER, CELL_QR_SIZE)
+    qr_x = (CELL_WIDTH - CELL_QR_SIZE) // 2
+    qr_y = 15
+    canvas.paste(qr_image, (qr_x, qr_y))
+
+    font_code = label_assets.get_font(28)
+    font_name = label_assets.get_font(22)
+
+    text_y = qr_y + CELL_QR_SIZE + 15
+    _draw_centered_text(draw, f"Code: {item_code}", text_y, font_code, CELL_WIDTH, 10)
+
+    text_y += 35
+    name_text = item_name
+    if len(name_text) > 15:
+        name_text = name_text[:12] + "..."
+    _draw_centered_text(draw, name_text, text_y, font_name, CELL_WIDTH, 10)
+
+    return canvas
+
+def render_item_labels(url, item_code, item_name):
+    """Encode an item once and return (label, sheet cell) from the same matrix"""
+    matrix = build_qr_matrix(url)
+    return render_label(matrix, item_code, item_name), render_sheet_cell(matrix, item_code, item_name)
+
+def new_a4_sheet():
+    return Image.new('RGB', (A4_WIDTH, A4_HEIGHT), 'white')
+
+def sheet_cell_origin(index):
+    """Top-left pixel of grid position index (row-major) on an A4 sheet"""
+    available_width = A4_WIDTH - (2 * SHEET_MARGIN_X)
+    available_height = A4_HEIGHT - (2 * SHEET_MARGIN_Y)
+    spacing_x = (available_width - (SHEET_COLS * CELL_WIDTH)) // (SHEET_COLS - 1)
+    spacing_y = (available_height - (SHEET_ROWS * CELL_HEIGHT)) // (SHEET_ROWS - 1)
+
+    row, col = divmod(index, SHEET_COLS)
+    x = SHEET_MARGIN_X + col * (CELL_WIDTH + spacing_x)
+    y = SHEET_MARGIN_Y + row * (CELL_HEIGHT + spacing_y)
+    return x, y
+
+def paste_sheet_cell(sheet, index, cell):
+    """Paste a cell at grid position index of an A4 sheet"""
+    sheet.paste(cell, sheet_cell_origin(index))
+
+@timed('draw')
+def render_a4_sheet(cells):
+    """A4 sheet from up to ITEMS_PER_SHEET cells, pasted as they arrive"""
+    sheet = new_a4_sheet()
+    for index, cell in enumerate(cells):
+        if index >= ITEMS_PER_SHEET:
+            break
+        paste_sheet_cell(sheet, index, cell)
+    return sheet
+
+@timed('png_encode')
+def encode_png(image):
+    """Encode a label image as a 300 DPI PNG"""
+    buffered = io.BytesIO()
+    image.save(buffered, format="PNG", dpi=(300, 300))
+    return buffered.getvalue()
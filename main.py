@@ -1,16 +1,15 @@
 import qrcode
-from PIL import Image
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
-import os
 import random
 import string
 
+import label_assets
+
 # Constants
 LOGO_SIZE = (80, 80)
 QR_SIZE = (80, 80)
 QR_VERSION = 1
-LOGO_FILE_NAME = '02.jpg'
 OUTPUT_PDF = 'QR_Codes.pdf'
 DEFAULT_COLUMN_SIZE = 8
 
@@ -47,18 +46,16 @@ def generate_qr_code_with_logo(item_id, qr_canvas, x_position, y_position):
     qr_code_image = qr_code.make_image().convert('RGB')
 
     try:
-        # Open and resize the logo image
-        logo_path = os.path.join(os.getcwd(), LOGO_FILE_NAME)
-        logo = Image.open(logo_path)
-        logo_resized = logo.resize(LOGO_SIZE)
-
-        # Calculate the logo position
-        logo_x_position = (qr_code_image.size[0] - logo_resized.size[0]) // 2
-        logo_y_position = (qr_code_image.size[1] - logo_resized.size[1]) // 2
-        logo_position = (logo_x_position, logo_y_position)
-
-        # Paste the logo on the QR code image
-        qr_code_image.paste(logo_resized, logo_position)
+        # Logo is decoded and resized once per process
+        logo_resized = label_assets.get_logo(LOGO_SIZE)
+        if logo_resized is not None:
+            # Calculate the logo position
+            logo_x_position = (qr_code_image.size[0] - logo_resized.size[0]) // 2
+            logo_y_position = (qr_code_image.size[1] - logo_resized.size[1]) // 2
+            logo_position = (logo_x_position, logo_y_position)
+
+            # Paste the logo on the QR code image
+            qr_code_image.paste(logo_resized, logo_position)
 
         # Draw the QR code image on the PDF canvas
         qr_canvas.drawInlineImage(qr_code_image, x_position, y_position, width=QR_SIZE[0], height=QR_SIZE[1])
@@ -0,0 +1,142 @@
+from collections import Counter
+import cProfile
+import os
+import re
+import sys
+import tempfile
+import threading
+import uuid
+
+from flask import abort, g, request, send_file
+
+from instrumentation import after_response
+
+# Off unless set, nothing is registered on the app then
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+# Profiles are written here and downloaded from /profiles/<id>
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'request_profiles'))
+# Seconds between stack samples
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+# Only the newest profiles are kept
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 50))
+
+# ?profile=1 or "X-Profile: 1" samples the request, "cprofile" traces every call instead
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ARG = 'profile'
+
+_PROFILE_NAME = re.compile(r'^[0-9a-f]{32}\.(folded|prof)$')
+
+class StackSampler:
+    """Samples one thread's stack from a background thread every interval seconds.
+
+    The result is in folded stack format ("outer;inner count" per line),
+    which flamegraph.pl, speedscope and inferno read as is. Only the GIL
+    switch and a stack walk per sample are added to the profiled thread.
+    """
+
+    extension = 'folded'
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.counts.most_common():
+                f.write(f'{stack} {count}\n')
+
+class CallProfiler:
+    """cProfile of every call, exact but slower, saved as pstats for snakeviz or flameprof"""
+
+    extension = 'prof'
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def write(self, path):
+        self.profile.dump_stats(path)
+
+def save_profile(profiler, profile_id):
+    """Write a stopped profiler to PROFILE_DIR and drop the oldest profiles"""
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.write(os.path.join(PROFILE_DIR, f'{profile_id}.{profiler.extension}'))
+        names = sorted((entry for entry in os.scandir(PROFILE_DIR) if _PROFILE_NAME.match(entry.name)),
+                       key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in names[PROFILE_KEEP:]:
+            os.remove(entry.path)
+    except OSError as e:
+        print(f'Profile error: {e}')
+
+def init_app(app, is_allowed):
+    """Profile single requests that ask for it when is_allowed() says the user may.
+
+    The profile covers the whole response, streamed bodies included, and its
+    download URL comes back in the X-Profile-URL header. Does nothing unless
+    PROFILING_ENABLED is set.
+    """
+    if not PROFILING_ENABLED:
+        return
+
+    @app.before_request
+    def start_profile():
+        mode = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_ARG)
+        if not mode or request.endpoint == 'download_profile' or not is_allowed():
+            return
+        if mode == 'cprofile':
+            profiler = CallProfiler()
+        else:
+            profiler = StackSampler(threading.get_ident())
+        g.profile = (uuid.uuid4().hex, profiler)
+        profiler.start()
+
+    @app.after_request
+    def finish_profile(response):
+        if 'profile' not in g:
+            return response
+        profile_id, profiler = g.profile
+        response.headers['X-Profile-URL'] = f'/profiles/{profile_id}.{profiler.extension}'
+
+        def finish():
+            profiler.stop()
+            save_profile(profiler, profile_id)
+
+        after_response(response, finish)
+        return response
+
+    @app.route('/profiles/<name>')
+    def download_profile(name):
+        if not is_allowed() or not _PROFILE_NAME.match(name):
+            abort(404)
+        path = os.path.join(PROFILE_DIR, name)
+        if not os.path.exists(path):
+            abort(404)
+        return send_file(path, mimetype='text/plain' if name.endswith('.folded') else 'application/octet-stream',
+                         as_attachment=True, download_name=f'profile_{name}')
@@ -0,0 +1,145 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from collections import deque
+import multiprocessing
+import os
+
+from PIL import Image
+
+import instrumentation
+import label_assets
+import label_render
+
+# Worker processes for label rendering, 0 or 1 renders in the calling thread.
+# Serial by default: every web worker gets its own pool and os.cpu_count() is
+# the host's, not the dyno's, so a pool has to be sized for the memory limit
+RENDER_WORKERS = int(os.environ.get('QR_RENDER_WORKERS', 1))
+# Tasks allowed in flight ahead of the ZIP/PDF writer
+RENDER_WINDOW = int(os.environ.get('QR_RENDER_WINDOW', max(RENDER_WORKERS * 2, 1)))
+
+_executor = None
+
+def get_executor():
+    """Process pool shared by the worker, None in serial mode"""
+    global _executor
+    if RENDER_WORKERS <= 1:
+        return None
+    if _executor is None:
+        # spawn so children never inherit the web worker's threads or DB connections
+        _executor = ProcessPoolExecutor(max_workers=RENDER_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+def reload_assets():
+    """Forget the logo and fonts here and in the pool, e.g. after 02.jpg was replaced.
+
+    Workers keep the assets they decoded, so the pool is replaced: tasks
+    already submitted finish on the old workers, new ones start fresh.
+    """
+    global _executor
+    label_assets.reload_assets()
+    executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False)
+
+class _TimedFuture:
+    """Pool future that reports the worker's render stage times when its result is read"""
+
+    def __init__(self, future):
+        self._future = future
+        self._reported = False
+
+    def done(self):
+        return self._future.done()
+
+    def cancel(self):
+        return self._future.cancel()
+
+    def result(self, timeout=None):
+        result, stages = self._future.result(timeout)
+        if not self._reported:
+            self._reported = True
+            instrumentation.add_stages(stages)
+        return result
+
+def _run_timed(task):
+    # Runs in the worker, stage times go back to the request with the result
+    func, args = task
+    with instrumentation.collect_stages() as stats:
+        result = func(args)
+    return result, stats.stages
+
+def submit(func, args):
+    """Run func(args) on the pool, or right away when rendering serially"""
+    executor = get_executor()
+    if executor is not None:
+        return _TimedFuture(executor.submit(_run_timed, (func, args)))
+
+    future = Future()
+    try:
+        future.set_result(func(args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+def imap_ordered(func, iterable, window=None):
+    """Map func over iterable on the pool and yield results in input order.
+
+    At most `window` tasks are in flight, so a slow consumer keeps memory
+    bounded no matter how many items are rendered.
+    """
+    if get_executor() is None:
+        for args in iterable:
+            yield func(args)
+        return
+
+    window = window or RENDER_WINDOW
+    pending = deque()
+    try:
+        for args in iterable:
+            pending.append(submit(func, args))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Client went away mid-export, drop work that has not started
+        for future in pending:
+            future.cancel()
+
+# Tasks run in worker processes: plain data in, encoded bytes out
+
+def cell_to_bytes(cell):
+    # Cells are black and white with grey text edges, L keeps them lossless
+    return cell.convert('L').tobytes()
+
+def cell_from_bytes(data):
+    return Image.frombytes('L', (label_render.CELL_WIDTH, label_render.CELL_HEIGHT), data)
+
+def render_item_task(args):
+    """(base_url, code, name, cached label PNG or None, whether its sheet cell is needed)
+    -> (code, name, label PNG, whether the label was rendered, raw sheet cell or None)
+
+    A cached label is passed through and the cell is only drawn for sheets
+    that are not stored, so an unchanged item is not rendered at all.
+    """
+    base_url, item_code, item_name, label_png, need_cell = args
+    if label_png is not None and not need_cell:
+        return item_code, item_name, label_png, False, None
+
+    matrix = label_render.build_qr_matrix(label_render.item_url(base_url, item_code))
+    rendered = label_png is None
+    if rendered:
+        label_png = label_render.encode_png(label_render.render_label(matrix, item_code, item_name))
+    cell = cell_to_bytes(label_render.render_sheet_cell(matrix, item_code, item_name)) if need_cell else None
+    return item_code, item_name, label_png, rendered, cell
+
+def render_cell_task(args):
+    """(base_url, code, name) -> raw sheet cell"""
+    base_url, item_code, item_name = args
+    matrix = label_render.build_qr_matrix(label_render.item_url(base_url, item_code))
+    return cell_to_bytes(label_render.render_sheet_cell(matrix, item_code, item_name))
+
+def render_sheet_task(cells):
+    """Raw sheet cells -> A4 sheet PNG"""
+    sheet = label_render.render_a4_sheet(cell_from_bytes(cell) for cell in cells)
+    return label_render.encode_png(sheet)
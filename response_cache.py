@@ -0,0 +1,69 @@
+from collections import OrderedDict
+from datetime import timezone
+import hashlib
+import os
+import threading
+
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 1000))
+
+class ResponseCache:
+    """Rendered bodies of single-item responses, least recently used dropped first.
+
+    Entries are keyed by (kind, item code, variant) and hold the item
+    version they were rendered from. A body is only returned for the
+    current version, so writes made by other worker processes never serve
+    a stale page. invalidate just frees the memory early.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, kind, item_code, variant, version):
+        key = (kind, item_code, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, kind, item_code, variant, version, body):
+        key = (kind, item_code, variant)
+        with self._lock:
+            self._entries[key] = (version, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, item_code):
+        """Drop every cached response of an item (edited or deleted)"""
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == item_code]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def make_etag(*parts):
+    return hashlib.sha1('\0'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+def http_last_modified(utc_dt):
+    """Naive UTC datetime as an aware one at the one second precision of HTTP dates"""
+    return utc_dt.replace(microsecond=0, tzinfo=timezone.utc)
+
+def is_not_modified(request, etag, last_modified):
+    """True if the client's conditional GET headers match the current version.
+
+    With an etag only If-None-Match counts: HTTP dates have one second
+    precision, so two edits in the same second share a Last-Modified.
+    """
+    if etag is not None:
+        return bool(request.if_none_match) and request.if_none_match.contains(etag)
+    if request.if_modified_since:
+        return last_modified <= request.if_modified_since
+    return False
+
+response_cache = ResponseCache()
@@ -64,4 +64,119 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         });
     }
-});
\ No newline at end of file
+    
+    // Infinite scroll: fetch the next page of cards when "Load more" comes into view
+    const itemsGrid = document.getElementById('itemsGrid');
+    const loadMore = document.getElementById('loadMore');
+    
+    if (itemsGrid && loadMore) {
+        let loading = false;
+        let observer = null;
+        
+        function loadNextPage() {
+            const fragmentUrl = loadMore.dataset.fragmentUrl;
+            if (loading || !fragmentUrl) {
+                return;
+            }
+            loading = true;
+            
+            fetch(fragmentUrl)
+                .then(function(response) {
+                    return response.json();
+                })
+                .then(function(data) {
+                    itemsGrid.insertAdjacentHTML('beforeend', data.html);
+                    if (data.next_url) {
+                        loadMore.dataset.fragmentUrl = data.next_url;
+                        loadMore.href = data.next_page_url;
+                    } else {
+                        if (observer) {
+                            observer.disconnect();
+                        }
+                        loadMore.parentElement.remove();
+                    }
+                    loading = false;
+                })
+                .catch(function() {
+                    // Fall back to following the link on the next click
+                    loading = false;
+                });
+        }
+        
+        loadMore.addEventListener('click', function(event) {
+            event.preventDefault();
+            loadNextPage();
+        });
+        
+        if ('IntersectionObserver' in window) {
+            observer = new IntersectionObserver(function(entries) {
+                if (entries[0].isIntersecting) {
+                    loadNextPage();
+                }
+            }, { rootMargin: '400px' });
+            observer.observe(loadMore);
+        }
+    }
+    
+    // QR exports run as background jobs: start one, show its progress, then download the file
+    document.querySelectorAll('[data-export-job]').forEach(function(button) {
+        button.addEventListener('click', function(event) {
+            event.preventDefault();
+            if (button.classList.contains('is-exporting')) {
+                return;
+            }
+            const label = button.innerHTML;
+            const params = new URLSearchParams(new URL(button.href, window.location.href).search);
+            params.set('format', button.dataset.exportJob);
+            button.classList.add('is-exporting');
+            
+            function finish(message) {
+                button.innerHTML = label;
+                button.classList.remove('is-exporting');
+                if (message) {
+                    alert(message);
+                }
+            }
+            
+            function poll(job) {
+                if (job.status === 'finished') {
+                    finish();
+                    window.location = job.download_url;
+                    return;
+                }
+                if (job.status === 'failed') {
+                    finish(job.error);
+                    return;
+                }
+                const progress = job.progress;
+                if (progress.items_total) {
+                    button.textContent = 'Preparing ' + progress.items_rendered + ' / ' + progress.items_total + '...';
+                }
+                setTimeout(function() {
+                    fetch(job.status_url)
+                        .then(function(response) {
+                            return response.json();
+                        })
+                        .then(poll)
+                        .catch(function() {
+                            finish('Lost track of the export, please try again');
+                        });
+                }, 1000);
+            }
+            
+            fetch(button.dataset.jobUrl, { method: 'POST', body: params })
+                .then(function(response) {
+                    if (!response.ok) {
+                        throw new Error(response.statusText);
+                    }
+                    return response.json();
+                })
+                .then(poll)
+                .catch(function() {
+                    // No job support, download in the request as before
+                    finish();
+                    window.location = button.href;
+                });
+        });
+    });
+});
@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, literal, or_, select
+
+# Movements stamped this long before a snapshot are replayed on top of it,
+# in case their transaction committed after the snapshot read the items
+SNAPSHOT_OVERLAP = timedelta(seconds=5)
+
+class StockLedger:
+    """Stock history from an append-only movement ledger plus snapshots.
+
+    Every movement stores the item's quantity, status and location after
+    it, so the state at any moment is the latest snapshot before it with
+    the last movement of each item in the short tail since applied on top.
+    Replaying a movement twice gives the same state, which makes the
+    overlap between a snapshot and its tail harmless.
+    """
+
+    def __init__(self, db, item_model, movement_model, snapshot_model):
+        self.db = db
+        self.item = item_model
+        self.movement = movement_model
+        self.snapshot = snapshot_model
+
+    def movement_values(self, item_id, item_code, reason, user_id=None, delta=0, quantity=None,
+                        from_status=None, to_status=None, from_location=None, to_location=None):
+        return {
+            'item_id': item_id,
+            'code': item_code,
+            'reason': reason,
+            'user_id': user_id,
+            'delta': delta,
+            'quantity': quantity,
+            'from_status': from_status,
+            'to_status': to_status,
+            'from_location': from_location,
+            'to_location': to_location,
+            'created_at': datetime.utcnow(),
+        }
+
+    def record(self, movements):
+        """Append movement value dicts in the current transaction"""
+        if movements:
+            self.db.session.execute(insert(self.movement), movements)
+
+    def take_snapshot(self):
+        """Copy every item's quantity, status and location in one statement. Returns its time"""
+        taken_at = datetime.utcnow()
+        S, I = self.snapshot, self.item
+        self.db.session.execute(
+            insert(S).from_select(
+                ['taken_at', 'item_id', 'code', 'quantity', 'status', 'location'],
+                select(literal(taken_at, S.taken_at.type), I.id, I.code, I.quantity, I.status, I.location)
+            )
+        )
+        self.db.session.commit()
+        return taken_at
+
+    def has_snapshot(self):
+        return self.db.session.query(self.snapshot.id).first() is not None
+
+    def stock_as_of(self, at, location=None):
+        """{item id: {code, quantity, status, location}} of the items that existed at at.
+
+        With location, only items there at that moment; the snapshot and
+        the tail are then both read through their location indexes.
+        """
+        S, M = self.snapshot, self.movement
+        taken_at = self.db.session.query(func.max(S.taken_at)).filter(S.taken_at <= at).scalar()
+
+        state = {}
+        if taken_at is not None:
+            rows = self.db.session.query(S.item_id, S.code, S.quantity, S.status, S.location).filter(S.taken_at == taken_at)
+            if location is not None:
+                rows = rows.filter(S.location == location)
+            for row in rows:
+                state[row.item_id] = {'code': row.code, 'quantity': row.quantity,
+                                      'status': row.status, 'location': row.location}
+
+        tail = self.db.session.query(M).filter(M.created_at <= at)
+        if taken_at is not None:
+            tail = tail.filter(M.created_at > taken_at - SNAPSHOT_OVERLAP)
+        if location is not None:
+            # Anything that arrived, left or changed while there touches one of the two
+            tail = tail.filter(or_(M.from_location == location, M.to_location == location))
+
+        for movement in tail.order_by(M.created_at, M.id):
+            if movement.reason == 'delete':
+                state.pop(movement.item_id, None)
+            else:
+                state[movement.item_id] = {'code': movement.code, 'quantity': movement.quantity,
+                                           'status': movement.to_status, 'location': movement.to_location}
+
+        if location is not None:
+            state = {item_id: item for item_id, item in state.items() if item['location'] == location}
+        return state
+
+    def location_movements(self, location, start=None, end=None):
+        """Query of movements into, out of or within location, between start and end"""
+        M = self.movement
+        query = self.db.session.query(M).filter(or_(M.from_location == location, M.to_location == location))
+        if start is not None:
+            query = query.filter(M.created_at >= start)
+        if end is not None:
+            query = query.filter(M.created_at <= end)
+        return query
@@ -0,0 +1,44 @@
+import zipfile
+
+from instrumentation import stage
+
+
+class _ChunkBuffer:
+    """Write-only file object that collects ZIP output until it is drained"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries, compression=zipfile.ZIP_DEFLATED):
+    """Yield a ZIP archive chunk by chunk from (name, data) entries.
+
+    The buffer has no tell/seek, so zipfile writes each entry with a data
+    descriptor instead of rewinding to patch its header. Only the entry
+    currently being compressed is ever held in memory.
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression) as zip_file:
+        for name, data in entries:
+            with stage('zip'):
+                zip_file.writestr(name, data)
+            chunk = buffer.drain()
+            if chunk:
+                yield chunk
+
+    # Central directory written on close
+    chunk = buffer.drain()
+    if chunk:
+        yield chunk